@@ -0,0 +1,169 @@
+# app/batch.py
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List
+
+# Allow running as `python app/batch.py` as well as `python -m app.batch`
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import OUTPUT_DIR, BATCH_MAX_PROCESSES, BATCH_THREADS_PER_PROCESS
+from app.output_store import OutputStore, REPORT_FILE_NAME
+from app.utils import logger
+
+# One agent (and therefore one loaded RAGHandler) per worker process
+_agent = None
+
+
+class LocalFile(io.BufferedReader):
+    """
+    A .docx file on disk, read on demand rather than loaded up front, with
+    the `name` and `size` of Streamlit's UploadedFile.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(io.FileIO(path, "rb"))
+        self.path = path
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+
+def discover_bundles(input_path: str) -> Dict[str, List[str]]:
+    """
+    Maps bundle names to their .docx files. `input_path` is either a JSON
+    manifest (`{"bundle name": ["a.docx", ...]}`, relative paths resolved
+    against the manifest's directory) or a directory whose sub-directories
+    are bundles. A directory holding .docx files directly is one bundle.
+    """
+    if os.path.isfile(input_path):
+        with open(input_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(input_path))
+        return {
+            name: [os.path.join(base_dir, path) for path in files]
+            for name, files in manifest.items()
+        }
+
+    def docx_files(directory):
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith(".docx") and not name.startswith("~$")
+        )
+
+    bundles = {}
+    for name in sorted(os.listdir(input_path)):
+        path = os.path.join(input_path, name)
+        if os.path.isdir(path) and docx_files(path):
+            bundles[name] = docx_files(path)
+    if not bundles and docx_files(input_path):
+        bundles[os.path.basename(os.path.abspath(input_path))] = docx_files(input_path)
+    return bundles
+
+
+def _init_worker(threads_per_process: int):
+    # Workers share the on-disk corpus index; its sync is serialized by a file lock,
+    # so the first worker brings it up to date and the rest load the result
+    global _agent
+    from app.core import CorporateAgent
+    _agent = CorporateAgent(max_workers=threads_per_process)
+
+
+def _process_bundle(name: str, files: List[str], bundle_dir: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    uploads = [LocalFile(path) for path in files]
+    try:
+        # Annotated documents and the report (written last) go straight to the bundle's folder
+        # The bundle name is the client reference its re-submissions are diffed against
+        report = _agent.analyze_submission(uploads, output_store=OutputStore(bundle_dir), client_id=name)
+    finally:
+        for upload in uploads:
+            upload.close()
+    if "error" in report and "document_analysis" not in report:
+        raise RuntimeError(report["error"])
+    return {
+        "bundle": name,
+        "status": "completed",
+        "report": report["report_path"],
+        "documents": report.get("documents_uploaded_count", 0),
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+def run_batch(input_path: str, output_dir: str, processes: int = BATCH_MAX_PROCESSES,
+              threads_per_process: int = BATCH_THREADS_PER_PROCESS, resume: bool = True) -> List[Dict[str, Any]]:
+    """
+    Analyzes every bundle under `input_path` across a process pool, writing each
+    bundle's report and annotated documents to its own folder in `output_dir`.
+    With `resume`, bundles that already have a report are skipped.
+    """
+    bundles = discover_bundles(input_path)
+    if not bundles:
+        logger.warning(f"No submission bundles found in {input_path}")
+        return []
+
+    results = []
+    pending = {}
+    for name, files in bundles.items():
+        bundle_dir = os.path.join(output_dir, name)
+        if resume and os.path.exists(os.path.join(bundle_dir, REPORT_FILE_NAME)):
+            logger.info(f"Skipping already processed bundle: {name}")
+            results.append({"bundle": name, "status": "skipped", "report": os.path.join(bundle_dir, REPORT_FILE_NAME)})
+        else:
+            pending[name] = (files, bundle_dir)
+
+    logger.info(f"Processing {len(pending)} of {len(bundles)} bundles with {processes} worker processes.")
+    if pending:
+        # "spawn" avoids forking a parent that may already hold torch/FAISS thread pools
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(processes, len(pending)), mp_context=context,
+                                 initializer=_init_worker, initargs=(threads_per_process,)) as executor:
+            futures = {
+                executor.submit(_process_bundle, name, files, bundle_dir): name
+                for name, (files, bundle_dir) in pending.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                    logger.info(f"Bundle '{name}' completed in {result['seconds']}s.")
+                except Exception as e:
+                    logger.error(f"Bundle '{name}' failed: {e}", exc_info=True)
+                    result = {"bundle": name, "status": "failed", "error": str(e)}
+                results.append(result)
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "batch_summary.json"), "w") as f:
+        json.dump(sorted(results, key=lambda r: r["bundle"]), f, indent=4)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze directories of submission bundles without the UI.")
+    parser.add_argument("input", help="Directory of bundle sub-directories, or a JSON manifest of bundles.")
+    parser.add_argument("--output-dir", default=os.path.join(OUTPUT_DIR, "batch"), help="Where to write per-bundle outputs.")
+    parser.add_argument("--processes", type=int, default=BATCH_MAX_PROCESSES, help="Number of worker processes.")
+    parser.add_argument("--threads", type=int, default=BATCH_THREADS_PER_PROCESS, help="Concurrent documents per process.")
+    parser.add_argument("--no-resume", action="store_true", help="Re-process bundles that already have a report.")
+    args = parser.parse_args()
+
+    results = run_batch(args.input, args.output_dir, args.processes, args.threads, resume=not args.no_resume)
+    failed = [r for r in results if r["status"] == "failed"]
+    if failed:
+        logger.error(f"{len(failed)} bundle(s) failed: {', '.join(r['bundle'] for r in failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
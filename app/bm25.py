@@ -0,0 +1,88 @@
+# app/bm25.py
+
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+from config import BM25_K1, BM25_B
+
+# Keeps identifiers such as "2020", "56.1" and "ubo" as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "shall any such which been not no all may".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 inverted index over the corpus chunks, keyed by the
+    same stable chunk IDs as the FAISS index.
+    """
+
+    def __init__(self, chunk_ids: List[int], doc_lengths: List[int], postings: dict,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.chunk_ids = chunk_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, chunks: Iterable) -> "BM25Index":
+        chunk_ids, doc_lengths, postings = [], [], {}
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk.page_content)
+            chunk_ids.append(int(chunk.chunk_id))
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, tf))
+        return cls(chunk_ids, doc_lengths, postings)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Returns up to k `(chunk_id, score)` pairs, best first."""
+        if not self.chunk_ids:
+            return []
+        num_docs = len(self.chunk_ids)
+        scores = {}
+        for term, query_tf in Counter(tokenize(query)).items():
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (num_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for row, tf in posting:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[row] / (self.avg_length or 1))
+                scores[row] = scores.get(row, 0.0) + query_tf * idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(self.chunk_ids[row], score) for row, score in best]
+
+    def save(self, path: str) -> None:
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "chunk_ids": self.chunk_ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {term: [tuple(entry) for entry in entries] for term, entries in data["postings"].items()}
+        return cls(data["chunk_ids"], data["doc_lengths"], postings, k1=data["k1"], b=data["b"])
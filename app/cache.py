@@ -0,0 +1,110 @@
+# app/cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+from app.utils import logger
+
+
+def make_cache_key(**parts) -> str:
+    """Builds a stable content-addressed key from JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Persistent SQLite cache for LLM analysis results.
+
+    Entries expire `ttl_seconds` after they were written and the least recently
+    used entries are evicted once more than `max_entries` are stored.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 5000, ttl_seconds: Optional[float] = None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS analysis_cache (
+                   key TEXT PRIMARY KEY,
+                   value TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_accessed REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_accessed ON analysis_cache(last_accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached value for `key`, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE analysis_cache SET last_accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Stores a value and evicts expired and least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, created_at, last_accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            if self.ttl_seconds is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM analysis_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+                )
+                self.evictions += cursor.rowcount
+            count = self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+            if count > self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM analysis_cache WHERE key IN "
+                    "(SELECT key FROM analysis_cache ORDER BY last_accessed ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self.evictions += cursor.rowcount
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis_cache")
+            self._conn.commit()
+        logger.info(f"Cleared analysis cache at {self.db_path}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters for this process and the current entry count."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
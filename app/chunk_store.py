@@ -0,0 +1,215 @@
+# app/chunk_store.py
+
+import os
+import json
+import mmap
+import hashlib
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+from app.utils import logger
+
+# Bump this whenever the on-disk layout changes so stale stores are rebuilt.
+CHUNK_STORE_VERSION = 2
+
+MANIFEST_FILE = "manifest.json"
+TEXTS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets"
+IDS_FILE = "chunks.ids"
+METADATA_FILE = "chunks.meta.json"
+LEXICAL_INDEX_FILE = "bm25.json"
+
+
+@dataclass
+class Chunk:
+    """
+    A single corpus chunk. Exposes `page_content` and `metadata` so it can be
+    used anywhere a LangChain `Document` was used before.
+    """
+    page_content: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    chunk_id: int = -1
+
+
+def hash_file(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def compute_corpus_hashes(corpus_dir: str) -> Dict[str, str]:
+    """Maps every .docx file in the corpus (relative path) to its content hash."""
+    hashes = {}
+    for root, _, files in os.walk(corpus_dir):
+        for name in files:
+            if not name.lower().endswith(".docx") or name.startswith("~$"):
+                continue
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, corpus_dir).replace(os.sep, "/")
+            hashes[rel_path] = hash_file(path)
+    return dict(sorted(hashes.items()))
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view over the chunks persisted next to the FAISS index.
+
+    Chunk texts live in one UTF-8 blob; only the byte offsets, chunk IDs and the
+    (small) metadata list are read eagerly, so opening a store is O(number of
+    chunks) and texts are decoded on access. Rows are positions in the store;
+    chunk IDs are the stable IDs the FAISS index returns.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(store_dir, METADATA_FILE), "r", encoding="utf-8") as f:
+            self._metadata = json.load(f)
+        self._offsets = array("Q")
+        with open(os.path.join(store_dir, OFFSETS_FILE), "rb") as f:
+            self._offsets.frombytes(f.read())
+        self._ids = array("q")
+        with open(os.path.join(store_dir, IDS_FILE), "rb") as f:
+            self._ids.frombytes(f.read())
+        self._row_by_id = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+
+        self._texts_file = open(os.path.join(store_dir, TEXTS_FILE), "rb")
+        if os.path.getsize(self._texts_file.name) > 0:
+            self._texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._texts = b""
+
+        if len(self._offsets) != len(self._metadata) + 1 or len(self._ids) != len(self._metadata):
+            raise ValueError(f"Chunk store at {store_dir} is corrupted: offsets, IDs and metadata disagree.")
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    def __getitem__(self, row: int) -> Chunk:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("chunk row out of range")
+        start, end = self._offsets[row], self._offsets[row + 1]
+        text = bytes(self._texts[start:end]).decode("utf-8")
+        return Chunk(page_content=text, metadata=dict(self._metadata[row]), chunk_id=self._ids[row])
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    @property
+    def chunk_ids(self) -> List[int]:
+        """Chunk IDs in row order."""
+        return self._ids.tolist()
+
+    def get(self, chunk_id: int) -> Optional[Chunk]:
+        """Returns the chunk with the given stable ID, or None if it is not in the store."""
+        row = self._row_by_id.get(int(chunk_id))
+        return None if row is None else self[row]
+
+    def chunk_ids_for_file(self, source_file: str) -> List[int]:
+        """Returns the IDs of every chunk that was split from the given corpus file."""
+        return [
+            self._ids[row] for row, metadata in enumerate(self._metadata)
+            if metadata.get("source_file") == source_file
+        ]
+
+    @property
+    def next_chunk_id(self) -> int:
+        return self.manifest.get("next_chunk_id", max(self._ids, default=-1) + 1)
+
+    def close(self):
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self._texts_file.close()
+
+
+def build_manifest(file_hashes: Dict[str, str], splitter_settings: Dict[str, Any],
+                   embedding_model: str, chunk_count: int, next_chunk_id: int = 0,
+                   index_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Describes everything the persisted chunks (and index rows) were derived from."""
+    return {
+        "version": CHUNK_STORE_VERSION,
+        "embedding_model": embedding_model,
+        "splitter": splitter_settings,
+        "index": index_settings,
+        "files": file_hashes,
+        "chunk_count": chunk_count,
+        "next_chunk_id": next_chunk_id,
+    }
+
+
+def _write_atomically(path: str, data: bytes) -> None:
+    # Replacing instead of truncating keeps any live memory map of the old file valid.
+    # The temporary name is per process so concurrent writers never share one.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def invalidate_chunk_store(store_dir: str) -> None:
+    """Removes the manifest so the store is treated as missing until rewritten."""
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def write_chunk_store(store_dir: str, chunks: List, manifest: Dict[str, Any]) -> None:
+    """
+    Persists chunk texts, metadata and the manifest. The manifest is written
+    last so a crash mid-write leaves a store that fails validation.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    invalidate_chunk_store(store_dir)
+
+    offsets = array("Q", [0])
+    ids = array("q")
+    metadata = []
+    texts = []
+    for chunk in chunks:
+        data = chunk.page_content.encode("utf-8")
+        texts.append(data)
+        offsets.append(offsets[-1] + len(data))
+        ids.append(chunk.chunk_id)
+        metadata.append(chunk.metadata)
+
+    _write_atomically(os.path.join(store_dir, TEXTS_FILE), b"".join(texts))
+    _write_atomically(os.path.join(store_dir, OFFSETS_FILE), offsets.tobytes())
+    _write_atomically(os.path.join(store_dir, IDS_FILE), ids.tobytes())
+    _write_atomically(os.path.join(store_dir, METADATA_FILE), json.dumps(metadata).encode("utf-8"))
+    _write_atomically(os.path.join(store_dir, MANIFEST_FILE), json.dumps(manifest, indent=2).encode("utf-8"))
+    logger.info(f"Chunk store with {len(chunks)} chunks saved to {store_dir}")
+
+
+def open_chunk_store(store_dir: str, expected_manifest: Dict[str, Any]) -> Optional[ChunkStore]:
+    """
+    Opens the store if it exists and was built with the expected layout version,
+    splitter settings, embedding model and index settings. Returns None otherwise. Differences in
+    the corpus files are left to the incremental indexer to resolve.
+    """
+    if not os.path.exists(os.path.join(store_dir, MANIFEST_FILE)):
+        return None
+    try:
+        store = ChunkStore(store_dir)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not open chunk store at {store_dir}: {e}")
+        return None
+
+    manifest = store.manifest
+    for key in ("version", "embedding_model", "splitter", "index"):
+        if manifest.get(key) != expected_manifest.get(key):
+            logger.info(f"Chunk store is stale ('{key}' changed). It will be rebuilt.")
+            store.close()
+            return None
+    if manifest.get("chunk_count") != len(store):
+        logger.warning("Chunk store manifest does not match its contents. It will be rebuilt.")
+        store.close()
+        return None
+    return store
@@ -1,38 +1,140 @@
 # app/core.py
 
+import os
 import json
-import io
-from typing import Dict, Any, List
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Iterator, Optional
 
-from app.doc_processor import parse_docx, identify_document_type, add_comments_to_docx
+from app.doc_processor import (
+    parse_docx, identify_document_type, add_comments_to_docx, is_general_issue, locate_issue
+)
+from app.metrics import trace_submission, current_trace, span, submit_in_context, export_trace
+from app.output_store import OutputStore
+from app.paragraph_index import ParagraphIndex
+from app.prompts import PROMPT_VERSION, merge_issues
 from app.rag_handler import RAGHandler
-from config import PROCESS_CHECKLISTS
+from app.revisions import (
+    RevisionStore, fingerprint_paragraphs, revision_key, diff_revisions,
+    changed_excerpt, carry_forward_issues
+)
+from config import (
+    PROCESS_CHECKLISTS, ANALYSIS_MAX_WORKERS, MAX_RETAINED_PARSED_DOCUMENTS,
+    REVISIONS_ENABLED, REVISION_STORE_PATH, REVISION_TTL_SECONDS,
+    REVISION_MIN_UNCHANGED_RATIO, REVISION_CONTEXT_PARAGRAPHS
+)
 from app.utils import logger
 
 class CorporateAgent:
-    def __init__(self):
+    def __init__(self, max_workers: int = ANALYSIS_MAX_WORKERS, warm_up_async: bool = False,
+                 rag_handler: RAGHandler = None, revisions_enabled: bool = REVISIONS_ENABLED):
         logger.info("Initializing Corporate Agent...")
-        self.rag_handler = RAGHandler()
+        self.max_workers = max(1, max_workers)
+        self.rag_handler = rag_handler or RAGHandler(warm_up_async=warm_up_async)
+        self.revision_store = RevisionStore(
+            REVISION_STORE_PATH, ttl_seconds=REVISION_TTL_SECONDS
+        ) if revisions_enabled else None
         logger.info("Corporate Agent initialized successfully.")
 
-    def analyze_submission(self, uploaded_files: List) -> Dict[str, Any]:
+    @property
+    def status(self) -> str:
+        """Readiness of the knowledge base: "loading", "ready" or "error"."""
+        return self.rag_handler.status
+
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        return self.rag_handler.wait_until_ready(timeout)
+
+    def analyze_submission(self, uploaded_files: List, use_cache: bool = True,
+                           output_store: OutputStore = None, client_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Orchestrates the full analysis of a batch of uploaded documents,
-        including checklist verification.
+        including checklist verification. When a `client_id` (a client or
+        matter reference) is given, documents that client submitted before
+        (same file name and type) are re-analyzed only where they changed; see
+        `_run_document_analysis`. Without one every document is analyzed in
+        full. Set `use_cache` to False to force fresh, full LLM analysis.
+        """
+        submission_report = None
+        for event in self.iter_submission(uploaded_files, use_cache=use_cache, output_store=output_store,
+                                          client_id=client_id):
+            if event["event"] == "error":
+                return {"error": event["error"]}
+            if event["event"] == "complete":
+                submission_report = event["report"]
+        return submission_report
+
+    def iter_submission(self, uploaded_files: List, use_cache: bool = True,
+                        output_store: OutputStore = None, client_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of `analyze_submission`. Yields events as soon as
+        they are available:
+
+        - "document_classified": one per parsed file, with its report `index`
+        - "document_skipped": a file that could not be parsed
+        - "checklist": the process identified and any missing documents
+        - "document_analyzed": one per document as its analysis finishes, in
+          completion order, with its report `index` and the report entry
+        - "complete": the final report, documents in upload order, with the
+          per-stage spans of the submission under "trace"
+        - "error": nothing could be analyzed
+
+        Annotated documents and the final report are written to `output_store`
+        (by default a new folder for this submission under
+        SUBMISSIONS_OUTPUT_DIR); report entries carry `annotated_file_path`.
         """
         if not uploaded_files:
-            return {"error": "No files were uploaded."}
+            yield {"event": "error", "error": "No files were uploaded."}
+            return
+
+        with trace_submission() as trace:
+            output_store = output_store or OutputStore.for_submission(trace.submission_id)
+            yield from self._iter_submission(uploaded_files, use_cache, output_store, client_id)
+            # Reached only when the submission ran to completion
+            export_trace(trace)
 
+    def _iter_submission(self, uploaded_files: List, use_cache: bool, output_store: OutputStore,
+                         client_id: Optional[str]) -> Iterator[Dict[str, Any]]:
         # --- Step 1: Classify all uploaded documents ---
         classified_docs = []
+        retained_limit = self.max_workers if MAX_RETAINED_PARSED_DOCUMENTS is None else MAX_RETAINED_PARSED_DOCUMENTS
         for file in uploaded_files:
-            text, error = parse_docx(file)
+            with span("parse", document=file.name, file_bytes=_upload_size(file)) as attributes:
+                parsed, error = parse_docx(file)
+                if parsed is not None:
+                    attributes["paragraphs"] = len(parsed.paragraphs)
+                    attributes["chars"] = len(parsed.text)
             if error:
                 # Skip files that can't be parsed, but log it
                 logger.error(f"Skipping unparsable file: {file.name}")
+                yield {"event": "document_skipped", "file_name": file.name, "error": error}
                 continue
-            doc_type = identify_document_type(text)
-            classified_docs.append({"file_name": file.name, "doc_type": doc_type, "text": text, "original_file": file})
+            with span("classify", document=file.name, chars=len(parsed.text)) as attributes:
+                doc_type = identify_document_type(parsed)
+                attributes["document_type"] = doc_type
+            # Parsed trees are kept only for the documents the analysis workers start
+            # on first; the rest keep just their paragraph texts and are re-parsed from the
+            # upload if they need annotating
+            classified_docs.append({
+                "file_name": file.name,
+                "doc_type": doc_type,
+                "paragraph_texts": parsed.paragraph_texts,
+                "parsed": parsed if len(classified_docs) < retained_limit else None,
+                "upload": file,
+                "client_id": client_id
+            })
+            del parsed
+            yield {
+                "event": "document_classified",
+                "index": len(classified_docs) - 1,
+                "file_name": file.name,
+                "document_type": doc_type
+            }
+
+        # Uploads sharing a base name (e.g. from different folders) get their report
+        # index in the annotated file name, so neither copy overwrites the other
+        base_names = Counter(os.path.basename(doc["file_name"]).lower() for doc in classified_docs)
+        for index, doc in enumerate(classified_docs):
+            doc["output_index"] = index if base_names[os.path.basename(doc["file_name"]).lower()] > 1 else None
 
         uploaded_doc_types = {doc["doc_type"] for doc in classified_docs}
 
@@ -48,6 +150,8 @@ class CorporateAgent:
 
         # --- Step 3: Create the final consolidated report ---
         submission_report = {
+            "submission_id": current_trace().submission_id,
+            "output_dir": output_store.directory,
             "process_identified": process_name,
             "documents_uploaded_count": len(classified_docs),
             "required_documents_count": len(required_docs),
@@ -55,32 +159,143 @@ class CorporateAgent:
             "missing_documents": missing_docs,
             "document_analysis": []
         }
+        yield {"event": "checklist", **{k: v for k, v in submission_report.items() if k != "document_analysis"}}
 
         # --- Step 4: Run individual analysis on each document ---
-        for doc in classified_docs:
-            logger.info(f"Analyzing individual document: {doc['file_name']}")
-            relevant_context = self.rag_handler.retrieve_relevant_docs(doc['text'])
-            llm_response_str = self.rag_handler.get_llm_response(doc['text'], relevant_context)
-
+        # Documents are analyzed concurrently and reported as they finish; the
+        # final report keeps them in upload order.
+        document_analysis = [None] * len(classified_docs)
+        workers = min(self.max_workers, len(classified_docs))
+        if workers > 1:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="doc-analysis")
             try:
-                analysis_results = json.loads(llm_response_str)
-            except json.JSONDecodeError:
-                analysis_results = {"error": "Failed to parse analysis from LLM."}
-
-            # Add comments to the docx file if issues are found
-            annotated_file_stream = None
-            issues = analysis_results.get("issues_found")
-            if issues:
-                doc['original_file'].seek(0)
-                file_stream = io.BytesIO(doc['original_file'].getvalue())
-                annotated_file_stream = add_comments_to_docx(file_stream, issues)
-
-
-            submission_report["document_analysis"].append({
-                "file_name": doc['file_name'],
-                "document_type": doc['doc_type'],
-                "analysis": analysis_results,
-                "annotated_file": annotated_file_stream
-            })
+                futures = {
+                    submit_in_context(executor, self._analyze_document, doc, use_cache, output_store): index
+                    for index, doc in enumerate(classified_docs)
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    document_analysis[index] = future.result()
+                    yield {"event": "document_analyzed", "index": index, "result": document_analysis[index]}
+            except BaseException:
+                # The caller stopped consuming the stream (GeneratorExit) or a document failed:
+                # drop the queued documents instead of blocking until their LLM calls are made
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            executor.shutdown(wait=True)
+        else:
+            for index, doc in enumerate(classified_docs):
+                document_analysis[index] = self._analyze_document(doc, use_cache, output_store)
+                yield {"event": "document_analyzed", "index": index, "result": document_analysis[index]}
+        submission_report["document_analysis"].extend(document_analysis)
 
-        return submission_report
+        if self.rag_handler.analysis_cache is not None:
+            submission_report["llm_cache"] = self.rag_handler.analysis_cache.stats()
+        submission_report["llm_metrics"] = self.rag_handler.llm_provider.metrics.stats()
+        submission_report["trace"] = current_trace().to_dict()
+
+        with span("save", kind="report"):
+            submission_report["report_path"] = output_store.save_report(submission_report)
+        yield {"event": "complete", "report": submission_report}
+
+    def _analyze_document(self, doc: Dict[str, Any], use_cache: bool, output_store: OutputStore) -> Dict[str, Any]:
+        """
+        Runs retrieval, LLM analysis and annotation for a single classified
+        document, then drops its text and parsed tree so memory does not grow
+        with the number of documents in the submission.
+        """
+        logger.info(f"Analyzing individual document: {doc['file_name']}")
+        try:
+            with span("analyze_document", document=doc['file_name'], paragraphs=len(doc['paragraph_texts'])):
+                return self._run_document_analysis(doc, use_cache, output_store)
+        finally:
+            for key in ("paragraph_texts", "parsed", "upload"):
+                doc.pop(key, None)
+
+    def _run_document_analysis(self, doc: Dict[str, Any], use_cache: bool, output_store: OutputStore) -> Dict[str, Any]:
+        paragraph_texts = doc['paragraph_texts']
+        fingerprints = fingerprint_paragraphs(paragraph_texts)
+        analyzer = f"{PROMPT_VERSION}:{self.rag_handler.llm_provider.model_id}"
+        # Revisions are only tracked within a client's own submissions
+        revision_store = self.revision_store if doc['client_id'] else None
+        key = revision_key(doc['client_id'], doc['file_name'], doc['doc_type']) if revision_store else None
+
+        # --- Diff against the client's previously analyzed revision of this document, if any ---
+        previous = None
+        if use_cache and revision_store is not None:
+            previous = revision_store.get(key, analyzer)
+        diff = diff_revisions(previous["fingerprints"], fingerprints) if previous else None
+
+        revision = {"mode": "full", "paragraphs": len(paragraph_texts)}
+        # Document-level issues, and issues that could not be placed at a paragraph, can't be
+        # re-detected from the changed clauses alone, so any change means re-running them in full
+        if diff is not None and diff.changed and any(
+            is_general_issue(issue) or issue.get("anchor_paragraph") is None for issue in previous["issues"]
+        ):
+            logger.info(f"{doc['file_name']} changed and has unanchored issues; re-analyzing it in full.")
+            diff = None
+        if diff is not None and diff.unchanged_ratio >= REVISION_MIN_UNCHANGED_RATIO:
+            carried_issues = carry_forward_issues(previous["issues"], diff)
+            revision.update(changed_paragraphs=len(diff.changed), carried_forward_issues=len(carried_issues))
+            excerpt = changed_excerpt(paragraph_texts, diff.changed, REVISION_CONTEXT_PARAGRAPHS)
+            if excerpt:
+                revision["mode"] = "incremental"
+                logger.info(f"Re-analyzing {len(diff.changed)} changed of {len(paragraph_texts)} paragraphs in {doc['file_name']}.")
+                analysis_results = self._analyze_text(excerpt, use_cache, changed_only=True)
+                if isinstance(analysis_results.get("issues_found"), list):
+                    analysis_results["issues_found"] = merge_issues([{"issues_found": carried_issues}, analysis_results])
+            else:
+                revision["mode"] = "unchanged"
+                analysis_results = {"issues_found": carried_issues}
+        else:
+            analysis_results = self._analyze_text("\n".join(paragraph_texts), use_cache)
+
+        # --- Anchor each issue to its paragraph, for annotation and for the next revision ---
+        issues = analysis_results.get("issues_found")
+        if issues:
+            paragraph_index = doc['parsed'].paragraph_index if doc['parsed'] else ParagraphIndex(paragraph_texts)
+            for issue in issues:
+                if not is_general_issue(issue):
+                    issue["anchor_paragraph"] = locate_issue(paragraph_index, issue)
+        # Only complete, genuine analyses become the stored revision; fallback and
+        # partially failed results carry "failed_shards" and are never replayed
+        if revision_store is not None and isinstance(issues, list) and "failed_shards" not in analysis_results:
+            revision_store.put(key, analyzer, fingerprints, issues)
+
+        # Add comments to the docx file if issues are found, saving it straight to the output store
+        annotated_file_path = None
+        if issues:
+            with span("annotate") as attributes:
+                parsed = doc['parsed'] or parse_docx(doc['upload'])[0]
+                if parsed is not None:
+                    attributes["paragraphs"] = len(parsed.paragraphs)
+                    annotated_file_path = add_comments_to_docx(
+                        parsed, issues, output=output_store.annotated_path(doc['file_name'], doc['output_index'])
+                    )
+
+        return {
+            "file_name": doc['file_name'],
+            "document_type": doc['doc_type'],
+            "analysis": analysis_results,
+            "revision": revision,
+            "annotated_file_path": annotated_file_path
+        }
+
+    def _analyze_text(self, text: str, use_cache: bool, changed_only: bool = False) -> Dict[str, Any]:
+        """Retrieves context for the text and returns the parsed LLM analysis."""
+        relevant_context = self.rag_handler.retrieve_relevant_docs(text)
+        llm_response_str = self.rag_handler.get_llm_response(
+            text, relevant_context, use_cache=use_cache, changed_only=changed_only
+        )
+        try:
+            return json.loads(llm_response_str)
+        except json.JSONDecodeError:
+            return {"error": "Failed to parse analysis from LLM."}
+
+
+def _upload_size(file) -> int:
+    """Size in bytes of an uploaded file (Streamlit uploads expose `size`, plain streams do not)."""
+    size = getattr(file, "size", None)
+    if size is None and hasattr(file, "getbuffer"):
+        size = file.getbuffer().nbytes
+    return size
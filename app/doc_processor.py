@@ -2,57 +2,188 @@
 
 import docx
 import io
+import os
 import re
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional, Union
 from docx.shared import RGBColor, Pt
 from docx.enum.text import WD_COLOR_INDEX
 
-from config import DOCUMENT_KEYWORDS
+from config import (
+    DOCUMENT_KEYWORDS, COMMENT_FUZZY_MATCH_THRESHOLD, CLASSIFIER_TITLE_CHARS,
+    CLASSIFIER_TITLE_WEIGHT, CLASSIFIER_HEADING_MAX_CHARS, CLASSIFIER_HEADING_WEIGHT,
+    CLASSIFIER_SCAN_LIMIT_KB
+)
+from app.paragraph_index import ParagraphIndex
+from app.metrics import span, annotate
 from app.utils import logger
 
-def parse_docx(file_upload) -> Tuple[str, str]:
+class ParsedDocument:
     """
-    Parses an uploaded .docx file to extract its text content.
+    A .docx file parsed once and shared by classification, retrieval and annotation.
+
+    Holds the python-docx tree together with the text of each paragraph, the
+    full text, its lowercased form and the character offset of each paragraph
+    within the full text. `paragraphs` keeps the original paragraph objects,
+    so lookups stay valid after comment paragraphs are inserted into the tree.
+    """
+
+    def __init__(self, name: str, document):
+        self.name = name
+        self.document = document
+        self.paragraphs = list(document.paragraphs)
+        self.paragraph_texts = [p.text for p in self.paragraphs]
+        self.text = "\n".join(self.paragraph_texts)
+        self.text_lower = self.text.lower()
+        self.paragraph_offsets = []
+        offset = 0
+        for paragraph_text in self.paragraph_texts:
+            self.paragraph_offsets.append(offset)
+            offset += len(paragraph_text) + 1
+        self._paragraph_index = None
+
+    @property
+    def paragraph_index(self) -> ParagraphIndex:
+        """Lookup index over the original paragraphs, built on first use."""
+        if self._paragraph_index is None:
+            self._paragraph_index = ParagraphIndex(self.paragraph_texts)
+        return self._paragraph_index
+
+def parse_docx(file_upload) -> Tuple[Optional[ParsedDocument], Optional[str]]:
+    """
+    Parses an uploaded .docx file once, reading directly from the upload stream.
     """
     try:
-        file_stream = io.BytesIO(file_upload.getvalue())
-        doc = docx.Document(file_stream)
-        full_text = "\n".join([para.text for para in doc.paragraphs])
+        file_upload.seek(0)
+        parsed = ParsedDocument(file_upload.name, docx.Document(file_upload))
         logger.info(f"Successfully parsed document: {file_upload.name}")
-        return full_text, None
+        return parsed, None
     except Exception as e:
         logger.error(f"Error parsing DOCX file {file_upload.name}: {e}", exc_info=True)
         return None, f"Failed to parse {file_upload.name}. It might be corrupted."
 
-def identify_document_type(doc_text: str) -> str:
+class DocumentClassifier:
+    """
+    Keyword classifier that finds every document type's keywords in a single
+    pass over the text, using one combined regex compiled from the keyword table.
+
+    Each hit is weighted by where it occurs: hits within the title area or on a
+    short heading line count more than hits in body text. Short keywords
+    (abbreviations such as "aoa") must match whole words.
+    """
+
+    def __init__(self, document_keywords: Dict[str, List[str]]):
+        self.type_order = list(document_keywords)
+        self.types_by_keyword = {}
+        for doc_type, keywords in document_keywords.items():
+            for keyword in keywords:
+                self.types_by_keyword.setdefault(keyword.lower(), []).append(doc_type)
+
+        # Longest keywords first so overlapping phrases prefer the most specific match
+        alternatives = []
+        for keyword in sorted(self.types_by_keyword, key=len, reverse=True):
+            escaped = re.escape(keyword)
+            alternatives.append(rf'\b{escaped}\b' if len(keyword) <= 4 else escaped)
+        self.pattern = re.compile("|".join(alternatives)) if alternatives else None
+
+    def rank(self, doc_text_lower: str, max_kb: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Returns `(document_type, score)` pairs for every matched type, best first."""
+        if self.pattern is None:
+            return []
+        if max_kb is not None:
+            doc_text_lower = doc_text_lower[:max_kb * 1024]
+
+        scores = {}
+        for match in self.pattern.finditer(doc_text_lower):
+            start = match.start()
+            if start < CLASSIFIER_TITLE_CHARS:
+                weight = CLASSIFIER_TITLE_WEIGHT
+            else:
+                line_start = doc_text_lower.rfind("\n", 0, start) + 1
+                line_end = doc_text_lower.find("\n", start)
+                line_end = len(doc_text_lower) if line_end == -1 else line_end
+                is_heading = line_end - line_start <= CLASSIFIER_HEADING_MAX_CHARS
+                weight = CLASSIFIER_HEADING_WEIGHT if is_heading else 1.0
+            for doc_type in self.types_by_keyword[match.group()]:
+                scores[doc_type] = scores.get(doc_type, 0.0) + weight
+
+        return sorted(scores.items(), key=lambda item: (-item[1], self.type_order.index(item[0])))
+
+_classifier = DocumentClassifier(DOCUMENT_KEYWORDS)
+
+def rank_document_types(doc_text: Union[str, ParsedDocument], max_kb: Optional[int] = CLASSIFIER_SCAN_LIMIT_KB) -> List[Tuple[str, float]]:
     """
-    Identifies the document type based on keywords.
+    Scores every document type whose keywords occur in the document, best first.
     """
-    doc_text_lower = doc_text.lower()
-    for doc_type, keywords in DOCUMENT_KEYWORDS.items():
-        if any(keyword in doc_text_lower for keyword in keywords):
-            logger.info(f"Document classified as: {doc_type}")
-            return doc_type
+    if isinstance(doc_text, ParsedDocument):
+        doc_text_lower = doc_text.text_lower
+    else:
+        doc_text_lower = doc_text.lower()
+    return _classifier.rank(doc_text_lower, max_kb=max_kb)
+
+def identify_document_type(doc_text: Union[str, ParsedDocument]) -> str:
+    """
+    Identifies the document type as the highest-scoring keyword match.
+    """
+    ranked = rank_document_types(doc_text)
+    if ranked:
+        doc_type, score = ranked[0]
+        logger.info(f"Document classified as: {doc_type} (score {score:.1f})")
+        return doc_type
     logger.warning("Could not classify document type.")
     return "Unknown"
 
-def add_comments_to_docx(file_stream: io.BytesIO, issues: List[Dict[str, str]]) -> io.BytesIO:
+def is_general_issue(issue: Dict[str, str]) -> bool:
+    """Issues about the document as a whole are placed at the top rather than at a paragraph."""
+    return any(keyword in issue.get("section", "").lower() for keyword in ["document", "overall", "general"])
+
+def clean_section_text(section: str) -> str:
+    """Normalizes the section text returned by the AI for matching against paragraphs."""
+    # --- THE FIX IS HERE ---
+    # Clean the section text from the AI to improve matching.
+    # This removes things like "Clause X:", "Section Y.", commas, etc.
+    cleaned_section_text = re.sub(r'^(clause|section)\s*\d*[,.]?\s*', '', section, flags=re.IGNORECASE).strip().lower()
+    # Further clean common trailing words
+    return re.sub(r'\s*(clause|section)$', '', cleaned_section_text, flags=re.IGNORECASE).strip()
+
+def locate_issue(paragraph_index: ParagraphIndex, issue: Dict[str, str]) -> Optional[int]:
+    """
+    Index of the paragraph a section comment belongs to: the issue's
+    `anchor_paragraph` if it has a valid one, otherwise the first paragraph
+    containing its cleaned section text, else the best fuzzy match.
+    """
+    anchor = issue.get("anchor_paragraph")
+    if isinstance(anchor, int) and 0 <= anchor < len(paragraph_index):
+        return anchor
+    cleaned_section_text = clean_section_text(issue.get("section", ""))
+    if not cleaned_section_text:
+        return None
+    return paragraph_index.find(cleaned_section_text, fuzzy_threshold=COMMENT_FUZZY_MATCH_THRESHOLD)
+
+def add_comments_to_docx(document: Union[ParsedDocument, io.BytesIO], issues: List[Dict[str, str]],
+                         output: Optional[str] = None) -> Union[io.BytesIO, str]:
     """
     Adds multiple formatted comment paragraphs to a .docx file based on a list of issues.
     This version uses more robust matching to place comments accurately.
+
+    Accepts an already parsed document (whose tree is annotated in place, so it
+    should only be annotated once) or a raw .docx stream. Issues carrying an
+    `anchor_paragraph` (e.g. carried forward from an earlier revision) are
+    placed at that paragraph. The annotated file is saved to the `output` path
+    if given (and the path returned), otherwise to a new in-memory stream.
     """
-    doc = docx.Document(file_stream)
+    if not isinstance(document, ParsedDocument):
+        document = ParsedDocument(getattr(document, "name", "document"), docx.Document(document))
+    doc = document.document
+    paragraphs = document.paragraphs
+    paragraph_index = document.paragraph_index
     
     commented_sections = set()
 
     # --- Handle General/Overall Comments ---
-    general_comments = [
-        issue for issue in issues 
-        if any(keyword in issue.get("section", "").lower() for keyword in ["document", "overall", "general"])
-    ]
+    general_comments = [issue for issue in issues if is_general_issue(issue)]
     
-    if general_comments:
-        first_paragraph = doc.paragraphs[0]
+    if general_comments and paragraphs:
+        first_paragraph = paragraphs[0]
         for issue in reversed(general_comments):
             section_key = issue.get("section", "").lower().strip()
             if section_key in commented_sections: continue
@@ -69,25 +200,16 @@ def add_comments_to_docx(file_stream: io.BytesIO, issues: List[Dict[str, str]])
     # --- Process Specific Section Comments ---
     for issue in issues:
         original_section_text = issue.get("section", "")
-        
-        # --- THE FIX IS HERE ---
-        # Clean the section text from the AI to improve matching.
-        # This removes things like "Clause X:", "Section Y.", commas, etc.
-        cleaned_section_text = re.sub(r'^(clause|section)\s*\d*[,.]?\s*', '', original_section_text, flags=re.IGNORECASE).strip().lower()
-        # Further clean common trailing words
-        cleaned_section_text = re.sub(r'\s*(clause|section)$', '', cleaned_section_text, flags=re.IGNORECASE).strip()
+        cleaned_section_text = clean_section_text(original_section_text)
 
         if not cleaned_section_text or cleaned_section_text in commented_sections:
             continue
 
         comment_text = f"Issue: {issue.get('issue')}\nSuggestion: {issue.get('suggestion')}"
 
-        target_para = None
-        for p in doc.paragraphs:
-            # Check if the cleaned section text is a substring of the paragraph's text
-            if cleaned_section_text in p.text.lower().strip():
-                target_para = p
-                break
+        # The anchored paragraph, else the first one containing the cleaned section text, else the best fuzzy match
+        target_index = locate_issue(paragraph_index, issue)
+        target_para = paragraphs[target_index] if target_index is not None else None
         
         if target_para:
             for r in target_para.runs:
@@ -105,7 +227,14 @@ def add_comments_to_docx(file_stream: io.BytesIO, issues: List[Dict[str, str]])
         else:
             logger.warning(f"Could not find a matching paragraph for section: '{original_section_text}'")
 
-    output_stream = io.BytesIO()
-    doc.save(output_stream)
+    annotate(issues=len(issues), comments_placed=len(commented_sections))
+    with span("save", kind="annotated_document") as attributes:
+        if output is not None:
+            doc.save(output)
+            attributes["output_bytes"] = os.path.getsize(output)
+            return output
+        output_stream = io.BytesIO()
+        doc.save(output_stream)
+        attributes["output_bytes"] = output_stream.tell()
     output_stream.seek(0)
     return output_stream
@@ -0,0 +1,175 @@
+# app/embeddings.py
+
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import EMBEDDING_BATCH_SIZE, EMBEDDING_QUERY_CACHE_SIZE
+from app.metrics import annotate
+from app.utils import logger
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+
+def _encode_vector(vector: np.ndarray, dtype: str):
+    """Serializes a float32 vector in the given storage dtype; returns (bytes, scale)."""
+    if dtype == "float16":
+        return vector.astype(np.float16).tobytes(), 1.0
+    if dtype == "int8":
+        # Symmetric per-vector quantization
+        scale = float(np.max(np.abs(vector))) / 127.0 or 1.0
+        return np.round(vector / scale).astype(np.int8).tobytes(), scale
+    return vector.astype(np.float32).tobytes(), 1.0
+
+
+def _decode_vector(blob: bytes, dtype: str, scale: float) -> np.ndarray:
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if dtype == "int8":
+        return np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32).copy()
+
+
+class EmbeddingCache:
+    """
+    Persistent SQLite cache of text embeddings keyed by a hash of the model
+    name and the exact text. Vectors are stored as float32, float16 or int8
+    (with a per-vector scale) to trade precision for space.
+    """
+
+    def __init__(self, db_path: str, storage_dtype: str = "float32"):
+        if storage_dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported embedding storage dtype: {storage_dtype}")
+        self.db_path = db_path
+        self.storage_dtype = storage_dtype
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   key TEXT PRIMARY KEY,
+                   dtype TEXT NOT NULL,
+                   scale REAL NOT NULL,
+                   vector BLOB NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, scale, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, dtype, scale, blob in rows:
+                    found[key] = _decode_vector(blob, dtype, scale)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Stores the vectors; returns them as they will be read back (rounded for lossy dtypes)."""
+        rows = []
+        stored = {}
+        for key, vector in vectors.items():
+            blob, scale = _encode_vector(vector, self.storage_dtype)
+            rows.append((key, self.storage_dtype, scale, blob))
+            stored[key] = _decode_vector(blob, self.storage_dtype, scale)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dtype, scale, vector) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+        return stored
+
+
+class Embedder:
+    """
+    Wraps a SentenceTransformer with batched encoding and caching.
+
+    `encode` is used for corpus chunks: unique texts are looked up in the
+    persistent cache and only misses are encoded, so re-chunking, re-indexing
+    and chunks repeated across similar templates reuse existing vectors.
+    `encode_queries` keeps an in-memory LRU of recent query vectors.
+    """
+
+    def __init__(self, model, model_name: str, cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, query_cache_size: int = EMBEDDING_QUERY_CACHE_SIZE):
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False, convert_to_numpy=True),
+            dtype=np.float32
+        )
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encodes texts through the persistent cache; returns a float32 matrix."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(list(set(keys))) if self.cache else {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        if missing:
+            vectors = self._encode(list(missing.values()))
+            encoded = dict(zip(missing.keys(), vectors))
+            if self.cache:
+                # Use the stored values, so an index built now matches one rebuilt from the cache later
+                encoded = self.cache.put_many(encoded)
+            found.update(encoded)
+        logger.info(f"Embedded {len(texts)} texts: {len(texts) - len(missing)} from cache, {len(missing)} encoded.")
+        annotate(cache_hits=len(texts) - len(missing), encoded=len(missing))
+        return np.vstack([found[key] for key in keys]).astype(np.float32)
+
+    def clear_query_cache(self) -> None:
+        """Forgets the recently seen query vectors, so the next queries are encoded again."""
+        with self._query_lock:
+            self._query_cache.clear()
+
+    def encode_queries(self, texts: List[str]) -> np.ndarray:
+        """Encodes query texts, reusing recently seen query vectors."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        results = [None] * len(texts)
+        missing = {}
+        with self._query_lock:
+            for i, text in enumerate(texts):
+                vector = self._query_cache.get(text)
+                if vector is not None:
+                    self._query_cache.move_to_end(text)
+                    results[i] = vector
+                else:
+                    missing.setdefault(text, []).append(i)
+        annotate(cache_hits=sum(vector is not None for vector in results), encoded=len(missing))
+        if missing:
+            vectors = self._encode(list(missing))
+            with self._query_lock:
+                for (text, positions), vector in zip(missing.items(), vectors):
+                    for i in positions:
+                        results[i] = vector
+                    self._query_cache[text] = vector
+                    self._query_cache.move_to_end(text)
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return np.vstack(results).astype(np.float32)
@@ -0,0 +1,241 @@
+# app/indexer.py
+
+import os
+import sys
+import argparse
+from typing import Dict, List, Tuple, Optional
+
+import faiss
+import numpy as np
+from filelock import FileLock
+
+# Allow running as `python app/indexer.py` as well as `python -m app.indexer`
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import (
+    CORPUS_DIR, FAISS_INDEX_PATH, CHUNK_STORE_DIR, EMBEDDING_MODEL,
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH,
+    EMBEDDING_STORAGE_DTYPE
+)
+from app.bm25 import BM25Index
+from app.chunk_store import (
+    LEXICAL_INDEX_FILE, Chunk, ChunkStore, build_manifest, compute_corpus_hashes,
+    invalidate_chunk_store, open_chunk_store, write_chunk_store
+)
+from app.utils import logger
+from app.vector_index import build_index, built_index_settings, index_settings, needs_retraining, prepare_vectors
+
+
+class CorpusIndexer:
+    """
+    Keeps the FAISS index and chunk store in sync with the corpus directory.
+
+    Every corpus file is tracked by content hash. On sync only added or changed
+    files are re-split and re-embedded; chunks of changed or deleted files are
+    removed from the ID-mapped index by their stable chunk IDs. Syncs hold a
+    file lock next to the index, so processes sharing the index (e.g. batch
+    workers) update it one at a time and the others find it up to date.
+    """
+
+    def __init__(self, embedding_model, corpus_dir: str = CORPUS_DIR,
+                 index_path: str = FAISS_INDEX_PATH, store_dir: str = CHUNK_STORE_DIR):
+        self.embedding_model = embedding_model
+        self.corpus_dir = corpus_dir
+        self.index_path = index_path
+        self.store_dir = store_dir
+        self.splitter_settings = {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+        self._text_splitter = None
+        self._lock = FileLock(index_path + ".lock")
+
+    def sync(self, full_rebuild: bool = False) -> Tuple[Optional[faiss.Index], List]:
+        """
+        Brings the index and chunk store up to date with the corpus and returns
+        `(index, chunk_store)`. Returns `(None, [])` if the corpus is empty.
+        """
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        with self._lock:
+            return self._sync(full_rebuild)
+
+    def _sync(self, full_rebuild: bool) -> Tuple[Optional[faiss.Index], List]:
+        current_hashes = compute_corpus_hashes(self.corpus_dir)
+        expected_manifest = build_manifest(
+            current_hashes, self.splitter_settings, EMBEDDING_MODEL, chunk_count=None,
+            index_settings=index_settings()
+        )
+
+        index, store = (None, None) if full_rebuild else self._open_existing(expected_manifest)
+        if store is None:
+            logger.info("Building the corpus index from scratch.")
+            previous_hashes, next_chunk_id = {}, 0
+        else:
+            previous_hashes, next_chunk_id = store.manifest.get("files", {}), store.next_chunk_id
+
+        added = [f for f in current_hashes if f not in previous_hashes]
+        changed = [f for f in current_hashes if f in previous_hashes and previous_hashes[f] != current_hashes[f]]
+        removed = [f for f in previous_hashes if f not in current_hashes]
+
+        if store is not None and not (added or changed or removed):
+            logger.info(f"Corpus index is up to date ({len(store)} chunks).")
+            return index, store
+
+        logger.info(f"Syncing corpus index: {len(added)} added, {len(changed)} changed, {len(removed)} removed.")
+        if not current_hashes:
+            logger.warning(f"No .docx files found in the corpus directory: {self.corpus_dir}. The RAG system will have no knowledge base.")
+            if store is not None:
+                store.close()
+            invalidate_chunk_store(self.store_dir)
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            return None, []
+
+        # --- Drop chunks belonging to changed or deleted files ---
+        stale_files = set(changed) | set(removed)
+        kept_chunks = []
+        if store is not None:
+            stale_ids = [cid for f in stale_files for cid in store.chunk_ids_for_file(f)]
+            kept_chunks = [chunk for chunk in store if chunk.metadata.get("source_file") not in stale_files]
+            store.close()
+            if stale_ids:
+                try:
+                    index.remove_ids(np.array(stale_ids, dtype=np.int64))
+                except RuntimeError:
+                    # Graph indexes such as HNSW cannot delete vectors; rebuild from the kept
+                    # chunks instead (their vectors come from the embedding cache).
+                    logger.info("Index type does not support removal; rebuilding it from the kept chunks.")
+                    index = None
+
+        # --- Split and embed only new or changed files ---
+        new_chunks = []
+        for rel_path in added + changed:
+            file_chunks = self._split_file(rel_path)
+            if file_chunks is None:
+                # Leave unreadable files out of the manifest so the next sync retries them
+                del expected_manifest["files"][rel_path]
+                continue
+            for chunk in file_chunks:
+                chunk.chunk_id = next_chunk_id
+                next_chunk_id += 1
+                new_chunks.append(chunk)
+
+        if index is not None and not new_chunks and not stale_files:
+            # Only retried files that still fail to load; the persisted index is unchanged
+            return index, ChunkStore(self.store_dir)
+
+        if index is not None and needs_retraining(index, len(kept_chunks) + len(new_chunks)):
+            # An IVF index trained on a smaller corpus has too few lists (or no PQ) for its size now
+            logger.info("The corpus has outgrown the trained index structure; retraining it on all chunks.")
+            index = None
+
+        chunks_to_add = new_chunks if index is not None else kept_chunks + new_chunks
+        if chunks_to_add:
+            logger.info(f"Creating embeddings for {len(chunks_to_add)} chunks...")
+            embeddings = prepare_vectors(
+                self.embedding_model.encode([chunk.page_content for chunk in chunks_to_add])
+            )
+            if index is None:
+                index = build_index(embeddings)
+            index.add_with_ids(embeddings, np.array([c.chunk_id for c in chunks_to_add], dtype=np.int64))
+        elif index is None:
+            logger.error("Cannot create FAISS index because no chunks were produced from the corpus.")
+            return None, []
+
+        # --- Persist: invalidate the store first so a crash never pairs mismatched files ---
+        all_chunks = kept_chunks + new_chunks
+        invalidate_chunk_store(self.store_dir)
+        # faiss.write_index writes in place, so write a temporary copy and swap it in
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        expected_manifest["chunk_count"] = len(all_chunks)
+        expected_manifest["next_chunk_id"] = next_chunk_id
+        expected_manifest["index_built"] = built_index_settings(index)
+        write_chunk_store(self.store_dir, all_chunks, expected_manifest)
+        # The lexical index is rebuilt from the chunk texts on every change (no embedding needed)
+        BM25Index.build(all_chunks).save(os.path.join(self.store_dir, LEXICAL_INDEX_FILE))
+        logger.info(f"FAISS index saved to {self.index_path} with {index.ntotal} vectors.")
+        return index, ChunkStore(self.store_dir)
+
+    def load_lexical_index(self, store) -> Optional[BM25Index]:
+        """
+        Loads the BM25 index persisted with the chunk store, rebuilding it if it
+        is missing or does not cover exactly the store's chunks.
+        """
+        if not store:
+            return None
+        path = os.path.join(self.store_dir, LEXICAL_INDEX_FILE)
+        if os.path.exists(path):
+            try:
+                lexical_index = BM25Index.load(path)
+                if lexical_index.chunk_ids == store.chunk_ids:
+                    return lexical_index
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load the lexical index: {e}")
+        logger.info("Rebuilding the lexical index from the chunk store.")
+        lexical_index = BM25Index.build(store)
+        with self._lock:
+            lexical_index.save(path)
+        return lexical_index
+
+    def _open_existing(self, expected_manifest: Dict) -> Tuple[Optional[faiss.Index], Optional[ChunkStore]]:
+        """Opens the persisted index and chunk store if they can be updated in place."""
+        if not os.path.exists(self.index_path):
+            logger.info("No FAISS index found. Creating a new one.")
+            return None, None
+        store = open_chunk_store(self.store_dir, expected_manifest)
+        if store is None:
+            return None, None
+        index = faiss.read_index(self.index_path)
+        if not isinstance(index, faiss.IndexIDMap) or index.ntotal != len(store):
+            logger.warning("FAISS index does not line up with the chunk store. Rebuilding.")
+            store.close()
+            return None, None
+        return index, store
+
+    @property
+    def text_splitter(self):
+        # LangChain is only imported when files actually need (re-)splitting
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(**self.splitter_settings)
+        return self._text_splitter
+
+    def _split_file(self, rel_path: str) -> Optional[List[Chunk]]:
+        """
+        Loads one corpus file and splits it into chunks tagged with its relative
+        path. Returns None if the file could not be loaded.
+        """
+        from langchain_community.document_loaders import Docx2txtLoader
+        path = os.path.join(self.corpus_dir, rel_path)
+        try:
+            docs = Docx2txtLoader(path).load()
+        except Exception as e:
+            logger.error(f"Failed to load corpus file {rel_path}: {e}", exc_info=True)
+            return None
+        chunks = []
+        for doc in self.text_splitter.split_documents(docs):
+            metadata = dict(doc.metadata)
+            metadata["source_file"] = rel_path
+            chunks.append(Chunk(page_content=doc.page_content, metadata=metadata))
+        return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-sync the ADGM corpus FAISS index with the corpus directory.")
+    parser.add_argument("--corpus-dir", default=CORPUS_DIR, help="Directory containing the corpus .docx files.")
+    parser.add_argument("--full", action="store_true", help="Discard the existing index and rebuild it from scratch.")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from app.embeddings import Embedder, EmbeddingCache
+    embedding_cache = EmbeddingCache(
+        EMBEDDING_CACHE_PATH, storage_dtype=EMBEDDING_STORAGE_DTYPE
+    ) if EMBEDDING_CACHE_ENABLED else None
+    embedder = Embedder(SentenceTransformer(EMBEDDING_MODEL), EMBEDDING_MODEL, cache=embedding_cache)
+    indexer = CorpusIndexer(embedder, corpus_dir=args.corpus_dir)
+    index, _ = indexer.sync(full_rebuild=args.full)
+    if index is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# app/llm_providers.py
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+from dotenv import load_dotenv
+
+from config import (
+    LLM_PROVIDER, LLM_MODEL, LLM_TIMEOUT_SECONDS, LLM_MAX_RETRIES,
+    LLM_RETRY_BACKOFF_SECONDS, LLM_STUB_LATENCY_SECONDS
+)
+from app.metrics import span
+from app.utils import logger, get_rate_limiter, estimate_tokens
+
+# --- API Key Loading ---
+load_dotenv()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# ---------------------
+
+# Exception class names (from google-api-core, grpc, httpx and requests) worth retrying.
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequests", "GatewayTimeout", "BadGateway", "Aborted",
+    "ConnectError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError",
+    "ConnectionError", "Timeout", "TimeoutError", "ConnectionResetError",
+}
+
+
+class LatencyMetrics:
+    """Thread-safe call counters and a rolling window of call latencies."""
+
+    def __init__(self, window: int = 1000):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            self._latencies.append(seconds)
+            if error:
+                self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls, errors, retries, total = self.calls, self.errors, self.retries, self.total_seconds
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4)
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "retries": retries,
+            "mean_latency_seconds": round(total / calls, 4) if calls else 0.0,
+            "p50_latency_seconds": percentile(0.50),
+            "p95_latency_seconds": percentile(0.95),
+        }
+
+
+class LLMProvider:
+    """
+    Base class for LLM providers. Subclasses implement `_invoke`; `invoke` adds
+    rate limiting, retry with exponential backoff on transient errors and
+    latency metrics.
+    """
+    name = "base"
+
+    def __init__(self, model: str = LLM_MODEL, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_seconds: float = LLM_RETRY_BACKOFF_SECONDS):
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.metrics = LatencyMetrics()
+        self.rate_limiter = get_rate_limiter(self.name)
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the provider and model, e.g. for cache keys."""
+        return f"{self.name}:{self.model}"
+
+    def configuration_error(self) -> Optional[str]:
+        """Returns a message if the provider cannot be used, otherwise None."""
+        return None
+
+    def invoke(self, prompt: str) -> str:
+        """Sends the prompt and returns the raw text content of the response."""
+        with span("llm_call", provider=self.name, model=self.model, prompt_tokens=estimate_tokens(prompt)) as attributes:
+            attempt = 0
+            while True:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                started = time.perf_counter()
+                try:
+                    content = self._invoke(prompt)
+                except Exception as e:
+                    self.metrics.record(time.perf_counter() - started, error=True)
+                    if attempt >= self.max_retries or not self._is_transient(e):
+                        raise
+                    attempt += 1
+                    attributes["retries"] = attempt
+                    self.metrics.record_retry()
+                    delay = self.backoff_seconds * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+                    logger.warning(f"Transient {self.name} error ({type(e).__name__}); retry {attempt}/{self.max_retries} in {delay:.1f}s.")
+                    time.sleep(delay)
+                    continue
+                self.metrics.record(time.perf_counter() - started)
+                attributes["response_tokens"] = estimate_tokens(content)
+                return content
+
+    def _invoke(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini via LangChain. A single long-lived client is shared by all
+    calls, so its underlying transport and HTTP/2 connections are reused.
+    """
+    name = "gemini"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def configuration_error(self) -> Optional[str]:
+        if not GEMINI_API_KEY:
+            return "GEMINI_API_KEY not found. Make sure it's set in your .env file."
+        return None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    self._client = ChatGoogleGenerativeAI(
+                        model=self.model,
+                        google_api_key=GEMINI_API_KEY,
+                        timeout=LLM_TIMEOUT_SECONDS,
+                        max_retries=1, # Retries are handled by LLMProvider.invoke
+                        model_kwargs={"response_mime_type": "application/json"}
+                    )
+        return self._client
+
+    def _invoke(self, prompt: str) -> str:
+        return self.client.invoke(prompt).content
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic offline provider for benchmarks and local runs. Returns
+    well-formed `issues_found` JSON derived from the submitted document text,
+    after an optional simulated latency.
+    """
+    name = "stub"
+
+    def __init__(self, latency_seconds: float = LLM_STUB_LATENCY_SECONDS, **kwargs):
+        kwargs.setdefault("model", "stub-v1")
+        super().__init__(**kwargs)
+        self.latency_seconds = latency_seconds
+
+    def _invoke(self, prompt: str) -> str:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        marker = "**User Submitted Document Text:**"
+        document_text = prompt.split(marker, 1)[-1]
+        lines = [line.strip() for line in document_text.splitlines() if len(line.strip()) > 20]
+        digest = hashlib.sha256(document_text.encode("utf-8")).digest()
+        issues = []
+        for i, line in enumerate(lines[:3]):
+            issues.append({
+                "section": line[:60],
+                "issue": f"Stub finding {digest[i] % 97} for this clause.",
+                "severity": ["Low", "Medium", "High"][digest[i] % 3],
+                "suggestion": "Review this clause against the applicable ADGM template."
+            })
+        return json.dumps({"issues_found": issues})
+
+
+LLM_PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    StubProvider.name: StubProvider,
+}
+
+
+def create_llm_provider(name: str = LLM_PROVIDER) -> LLMProvider:
+    """Instantiates the configured LLM provider."""
+    provider_cls = LLM_PROVIDERS.get(name)
+    if provider_cls is None:
+        raise ValueError("Unsupported LLM provider specified in config.")
+    return provider_cls()
@@ -3,16 +3,51 @@
 import sys
 import os
 import streamlit as st
-import json
 
 # --- Path Correction ---
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # ---------------------
 
 from app.core import CorporateAgent
-from config import OUTPUT_DIR
 from app.utils import logger
 
+def render_checklist(checklist):
+    """Displays the submission completeness results."""
+    if checklist['process_identified'] != "Unknown":
+        st.info(f"**Process Identified:** {checklist['process_identified']}")
+        if checklist['is_complete']:
+            st.success("✅ All required documents appear to be present.")
+        else:
+            st.error(f"❌ Missing {len(checklist['missing_documents'])} required document(s):")
+            for doc in checklist['missing_documents']:
+                st.markdown(f"- `{doc}`")
+    else:
+        st.warning("Could not identify a specific legal process based on the uploaded files.")
+
+def render_document_analysis(doc_analysis):
+    """Displays the analysis of one document and its download button."""
+    with st.expander(f"**File:** `{doc_analysis['file_name']}`", expanded=True):
+        st.success(f"**Identified Document Type:** {doc_analysis['document_type']}")
+        st.json(doc_analysis['analysis'])
+        annotated_file_path = doc_analysis.get("annotated_file_path")
+        if annotated_file_path and os.path.exists(annotated_file_path):
+            # The annotated file lives in the submission's output folder; it is only read for the button
+            with open(annotated_file_path, "rb") as annotated_file:
+                st.download_button(
+                    label=f"Download Annotated {doc_analysis['file_name']}",
+                    data=annotated_file,
+                    file_name=f"reviewed_{doc_analysis['file_name']}",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                )
+
+@st.cache_resource(show_spinner=False)
+def get_agent() -> CorporateAgent:
+    """
+    One agent per server process, shared by every browser session. The
+    embedding model and index load in the background while the page renders.
+    """
+    return CorporateAgent(warm_up_async=True)
+
 def main():
     st.set_page_config(
         page_title="Corporate Agent - ADGM Compliance",
@@ -20,15 +55,23 @@ def main():
         layout="wide"
     )
 
-    if 'agent' not in st.session_state:
-        with st.spinner("Warming up the AI engine... This may take a moment."):
-            st.session_state.agent = CorporateAgent()
+    agent = get_agent()
 
     st.sidebar.title("Corporate Agent")
     st.sidebar.info(
         "An AI assistant for ADGM business incorporation and compliance. "
         "Upload all documents for your submission and click 'Analyze'."
     )
+    if agent.status == "ready":
+        st.sidebar.success("AI engine ready.")
+    elif agent.status == "loading":
+        st.sidebar.warning("Warming up the AI engine in the background...")
+    else:
+        st.sidebar.error("The AI engine failed to load. Please check the logs.")
+        # Drop the failed agent from the cache so the next run loads a fresh one
+        get_agent.clear()
+        if st.sidebar.button("Retry loading the AI engine"):
+            st.rerun()
 
     st.title("ADGM Corporate Agent 🤖")
     st.markdown("### Your AI-Powered Legal Compliance Assistant")
@@ -40,55 +83,72 @@ def main():
         type=['docx'],
         accept_multiple_files=True
     )
+    client_id = st.text_input(
+        "Client / matter reference (optional)",
+        help="Re-submissions under the same reference only re-analyze the clauses that changed."
+    ).strip()
 
     if st.button("Analyze Submission", disabled=not uploaded_files):
-        with st.spinner("Analyzing full submission... This may take a few minutes."):
-            try:
-                # Call the new submission analysis function
-                report = st.session_state.agent.analyze_submission(uploaded_files)
-
-                st.markdown("---")
-                st.header("2. Submission Analysis Report")
-
-                # Display the checklist results
-                st.subheader("Submission Completeness")
-                if report['process_identified'] != "Unknown":
-                    st.info(f"**Process Identified:** {report['process_identified']}")
-                    if report['is_complete']:
-                        st.success("✅ All required documents appear to be present.")
+        if agent.status == "loading":
+            with st.spinner("Warming up the AI engine... This may take a moment."):
+                agent.wait_until_ready()
+        if agent.status == "error":
+            get_agent.clear()
+            st.error("The AI engine failed to load. Please check the logs and try again.")
+            return
+        try:
+            st.markdown("---")
+            st.header("2. Submission Analysis Report")
+            progress = st.progress(0.0, text="Reading and classifying documents...")
+
+            # Containers are laid out up front and filled in as events arrive
+            st.subheader("Submission Completeness")
+            checklist_area = st.container()
+            st.subheader("Individual Document Review")
+            documents_area = st.container()
+
+            document_slots = {}
+            analyzed_count = 0
+            report = None
+            # Call the streaming submission analysis and render each result as soon as it is ready
+            for event in agent.iter_submission(uploaded_files, client_id=client_id or None):
+                kind = event["event"]
+                if kind == "error":
+                    st.error(event["error"])
+                    break
+                elif kind == "document_skipped":
+                    documents_area.warning(f"Skipped `{event['file_name']}`: {event['error']}")
+                elif kind == "document_classified":
+                    document_slots[event["index"]] = documents_area.empty()
+                    document_slots[event["index"]].info(
+                        f"**File:** `{event['file_name']}` — classified as **{event['document_type']}**. Analysis in progress..."
+                    )
+                elif kind == "checklist":
+                    with checklist_area:
+                        render_checklist(event)
+                    if not document_slots:
+                        progress.progress(1.0, text="No documents could be analyzed.")
                     else:
-                        st.error(f"❌ Missing {len(report['missing_documents'])} required document(s):")
-                        for doc in report['missing_documents']:
-                            st.markdown(f"- `{doc}`")
-                else:
-                    st.warning("Could not identify a specific legal process based on the uploaded files.")
-
-                # Display the analysis for each individual document
-                st.subheader("Individual Document Review")
-                for doc_analysis in report['document_analysis']:
-                    with st.expander(f"**File:** `{doc_analysis['file_name']}`", expanded=True):
-                        st.success(f"**Identified Document Type:** {doc_analysis['document_type']}")
-                        st.json(doc_analysis['analysis'])
-                        if doc_analysis.get("annotated_file"):
-                            st.download_button(
-                                label=f"Download Annotated {doc_analysis['file_name']}",
-                                data=doc_analysis["annotated_file"],
-                                file_name=f"reviewed_{doc_analysis['file_name']}",
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                            )
-
-                # Save the full report
-                report_path = os.path.join(OUTPUT_DIR, "submission_report.json")
-                # We can't save the file streams in JSON, so we remove them for the report
-                for doc in report['document_analysis']:
-                    doc.pop('annotated_file', None)
-                with open(report_path, 'w') as f:
-                    json.dump(report, f, indent=4)
-                st.success(f"Full submission report saved to: `{report_path}`")
-
-            except Exception as e:
-                logger.error(f"An unexpected error occurred during submission analysis: {e}", exc_info=True)
-                st.error("A critical error occurred during the analysis. Please check the logs.")
+                        progress.progress(0.0, text=f"Analyzing {len(document_slots)} document(s)...")
+                elif kind == "document_analyzed":
+                    analyzed_count += 1
+                    with document_slots[event["index"]].container():
+                        render_document_analysis(event["result"])
+                    progress.progress(
+                        analyzed_count / len(document_slots),
+                        text=f"Analyzed {analyzed_count} of {len(document_slots)} document(s)"
+                    )
+                elif kind == "complete":
+                    report = event["report"]
+
+            if report is not None:
+                progress.progress(1.0, text="Analysis complete.")
+                # The report and annotated files were saved to the submission's output folder
+                st.success(f"Full submission report saved to: `{report['report_path']}`")
+
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during submission analysis: {e}", exc_info=True)
+            st.error("A critical error occurred during the analysis. Please check the logs.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,189 @@
+# app/metrics.py
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from config import METRICS_ENABLED, METRICS_SPANS_PATH, METRICS_PROMETHEUS_PATH
+from app.utils import logger
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """Collects the spans recorded while one submission is analyzed."""
+
+    def __init__(self, submission_id: Optional[str] = None):
+        self.submission_id = submission_id or uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]):
+        with self._lock:
+            self.spans.append(span)
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, total and maximum duration per stage."""
+        summary = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = summary.setdefault(span["name"], {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stage["count"] += 1
+            stage["total_seconds"] = round(stage["total_seconds"] + span["duration_seconds"], 6)
+            stage["max_seconds"] = max(stage["max_seconds"], span["duration_seconds"])
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_time"])
+        return {
+            "submission_id": self.submission_id,
+            "started_at": self.started_at,
+            "stage_summary": self.stage_summary(),
+            "spans": spans,
+        }
+
+
+class _StageHistograms:
+    """
+    Process-wide latency histograms per stage, rendered in Prometheus text
+    format with a `pid` label so the series of concurrent processes stay apart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._stages.setdefault(stage, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def render(self) -> str:
+        pid = os.getpid()
+        lines = [
+            "# HELP corporate_agent_stage_duration_seconds Duration of Corporate Agent pipeline stages.",
+            "# TYPE corporate_agent_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._stages.items()):
+                labels = f'stage="{stage}",pid="{pid}"'
+                for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                    lines.append(f'corporate_agent_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'corporate_agent_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f'corporate_agent_stage_duration_seconds_sum{{{labels}}} {histogram["sum"]:.6f}')
+                lines.append(f'corporate_agent_stage_duration_seconds_count{{{labels}}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+stage_histograms = _StageHistograms()
+
+
+@contextmanager
+def trace_submission(submission_id: Optional[str] = None):
+    """Makes a new Trace current for the duration of the block and yields it."""
+    trace = Trace(submission_id)
+    previous_trace = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(previous_trace)
+        except ValueError:
+            # Generators may be closed from a different context than they started in
+            _current_trace.set(None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a pipeline stage. Yields the span's attribute dict, which callers
+    (and `annotate`) may extend while the stage runs. Spans inherit the
+    `document` attribute of their enclosing span.
+    """
+    if not METRICS_ENABLED:
+        yield attributes
+        return
+    parent = _current_span.get()
+    record = {
+        "name": name,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "document": attributes.pop("document", None) or (parent["document"] if parent else None),
+        "attributes": attributes,
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    record["start_time"] = time.time()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_seconds"] = round(time.perf_counter() - started, 6)
+        _current_span.reset(token)
+        stage_histograms.observe(name, record["duration_seconds"])
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(record)
+
+
+def annotate(**attributes):
+    """Adds attributes (e.g. cache-hit flags or token counts) to the innermost active span."""
+    current = _current_span.get()
+    if current is not None:
+        current["attributes"].update(attributes)
+
+
+def submit_in_context(executor, fn, *args):
+    """Submits `fn` to an executor so it runs with the caller's trace and span."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def map_in_context(executor, fn, items: List) -> List:
+    """Like `list(executor.map(fn, items))`, propagating the caller's trace and span."""
+    futures = [submit_in_context(executor, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def export_trace(trace: Trace, spans_path: str = METRICS_SPANS_PATH, prometheus_path: str = METRICS_PROMETHEUS_PATH):
+    """
+    Appends the trace's spans to a JSON-lines file and rewrites this process's
+    Prometheus textfile (`prometheus_path` with the process ID before the
+    extension) with its stage histograms. Each process (e.g. each batch worker)
+    owns its file, so its counters only ever increase.
+    """
+    if not METRICS_ENABLED:
+        return
+    try:
+        os.makedirs(os.path.dirname(spans_path), exist_ok=True)
+        with open(spans_path, "a", encoding="utf-8") as f:
+            for record in trace.to_dict()["spans"]:
+                f.write(json.dumps({"submission_id": trace.submission_id, **record}, default=str) + "\n")
+        root, extension = os.path.splitext(prometheus_path)
+        process_path = f"{root}.{os.getpid()}{extension}"
+        tmp_path = f"{process_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(stage_histograms.render())
+        os.replace(tmp_path, process_path)
+    except OSError as e:
+        logger.error(f"Failed to export pipeline metrics: {e}")
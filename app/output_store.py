@@ -0,0 +1,73 @@
+# app/output_store.py
+
+import os
+import json
+import time
+import shutil
+from typing import Dict, Any, Optional
+
+from config import SUBMISSIONS_OUTPUT_DIR, SUBMISSION_RETENTION_HOURS
+from app.utils import logger
+
+REPORT_FILE_NAME = "submission_report.json"
+
+
+class OutputStore:
+    """
+    The output folder of one submission. Annotated documents are saved
+    straight to disk as each one is produced, so reports carry file paths
+    instead of in-memory buffers.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def for_submission(cls, submission_id: str, root: str = SUBMISSIONS_OUTPUT_DIR) -> "OutputStore":
+        purge_expired_submissions(root)
+        return cls(os.path.join(root, submission_id))
+
+    @property
+    def report_path(self) -> str:
+        return os.path.join(self.directory, REPORT_FILE_NAME)
+
+    def annotated_path(self, file_name: str, index: Optional[int] = None) -> str:
+        """
+        Where the annotated copy of `file_name` is saved. Pass the document's
+        report `index` when other uploads share its base name, so their copies
+        do not overwrite each other.
+        """
+        prefix = "reviewed_" if index is None else f"reviewed_{index + 1}_"
+        return os.path.join(self.directory, prefix + os.path.basename(file_name))
+
+    def save_report(self, report: Dict[str, Any]) -> str:
+        """
+        Writes the JSON report atomically; since it is written last, its
+        presence marks the submission as complete.
+        """
+        tmp_path = self.report_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=4)
+        os.replace(tmp_path, self.report_path)
+        return self.report_path
+
+
+def purge_expired_submissions(root: str = SUBMISSIONS_OUTPUT_DIR,
+                              max_age_hours: float = SUBMISSION_RETENTION_HOURS) -> int:
+    """Removes submission folders last modified more than `max_age_hours` ago."""
+    if max_age_hours is None or not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"Could not remove expired submission output {path}: {e}")
+    if removed:
+        logger.info(f"Removed {removed} expired submission output folder(s).")
+    return removed
@@ -0,0 +1,75 @@
+# app/paragraph_index.py
+
+import re
+from collections import Counter
+from typing import List, Optional
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class ParagraphIndex:
+    """
+    Inverted word index over a document's paragraphs for placing comments.
+
+    Paragraph texts are normalized (lowercased, stripped) once. A word of the
+    query that is delimited on both sides *within the query* must appear as a
+    whole word in any paragraph containing the query, so intersecting those
+    words' postings (smallest first) yields a small candidate set that is then
+    verified with a plain substring check. This keeps the original "first
+    paragraph containing the section text" behavior without scanning every
+    paragraph per issue. When no paragraph contains the query, the paragraph
+    sharing the largest fraction of the query's words can be returned instead.
+    """
+
+    def __init__(self, paragraph_texts: List[str]):
+        self.texts = [text.lower().strip() for text in paragraph_texts]
+        self._postings = {}
+        for i, text in enumerate(self.texts):
+            for word in set(WORD_PATTERN.findall(text)):
+                self._postings.setdefault(word, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def find(self, query: str, fuzzy_threshold: Optional[float] = None) -> Optional[int]:
+        """
+        Returns the index of the first paragraph containing `query`. If there is
+        none and `fuzzy_threshold` is set, returns the best fuzzy match scoring at
+        least that threshold (earliest paragraph on ties), else None.
+        """
+        query = query.lower()
+        if not query:
+            return None
+
+        # Words touching either end of the query may be partial words in the paragraph
+        whole_words = {
+            match.group() for match in WORD_PATTERN.finditer(query)
+            if match.start() > 0 and match.end() < len(query)
+        }
+        if whole_words:
+            postings = sorted((self._postings.get(word, []) for word in whole_words), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
+            match_index = next((i for i in sorted(candidates) if query in self.texts[i]), None)
+        else:
+            match_index = next((i for i, text in enumerate(self.texts) if query in text), None)
+
+        if match_index is not None or fuzzy_threshold is None:
+            return match_index
+        return self.find_fuzzy(query, fuzzy_threshold)
+
+    def find_fuzzy(self, query: str, threshold: float) -> Optional[int]:
+        """Returns the paragraph containing the largest fraction of the query's words."""
+        words = set(WORD_PATTERN.findall(query.lower()))
+        if not words:
+            return None
+        overlap = Counter()
+        for word in words:
+            overlap.update(self._postings.get(word, ()))
+        if not overlap:
+            return None
+        best, shared = min(overlap.items(), key=lambda item: (-item[1], item[0]))
+        return best if shared / len(words) >= threshold else None
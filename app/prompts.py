@@ -0,0 +1,96 @@
+# app/prompts.py
+
+from typing import List
+
+from app.utils import estimate_tokens, split_into_clauses
+
+# Bump whenever the analysis prompt changes so cached results are not reused.
+PROMPT_VERSION = "2"
+
+ANALYSIS_PROMPT_TEMPLATE = """
+        Analyze the **User Submitted Document Text** based on the **ADGM Legal Context**.
+        Identify compliance issues, red flags, or missing information.{part_note}
+        Your entire response must be a single, valid JSON object.
+        This object must have one key: "issues_found".
+        The value of "issues_found" must be a JSON array of objects.
+        Each object in the array must contain four string keys: "section", "issue", "severity", and "suggestion".
+        Do not include any text, explanations, or markdown formatting before or after the JSON object.
+
+        **ADGM Legal Context:**
+        ---
+        {context}
+        ---
+
+        **User Submitted Document Text:**
+        ---
+        {document}
+        ---
+        """
+
+PART_NOTE = (
+    "\n        The text below is part {part} of {total} of a longer document; only report issues"
+    " visible in this part and do not flag other parts as missing."
+)
+
+CHANGED_ONLY_NOTE = (
+    "\n        The text below holds only the clauses that changed since this document was last"
+    " reviewed (with neighbouring clauses for context); only report issues in these clauses"
+    " and do not flag other clauses as missing."
+)
+
+TEMPLATE_TOKENS = estimate_tokens(ANALYSIS_PROMPT_TEMPLATE + PART_NOTE + CHANGED_ONLY_NOTE)
+
+
+def select_context(relevant_docs: list, token_budget: int) -> List:
+    """Keeps retrieved chunks, in rank order, until the token budget is used up."""
+    selected = []
+    used_tokens = 0
+    for doc in relevant_docs:
+        doc_tokens = estimate_tokens(doc.page_content)
+        if used_tokens + doc_tokens > token_budget:
+            break
+        selected.append(doc)
+        used_tokens += doc_tokens
+    return selected
+
+
+def shard_document(document_text: str, max_tokens: int) -> List[str]:
+    """
+    Splits a document into shards of whole clause groups, each within
+    `max_tokens`. Returns a single shard if the document already fits.
+    """
+    if estimate_tokens(document_text) <= max_tokens:
+        return [document_text]
+    return split_into_clauses(document_text, max_chars=max(1, max_tokens) * 4)
+
+
+def build_analysis_prompt(document_text: str, context_docs: list, part: int = 1, total: int = 1,
+                          changed_only: bool = False) -> str:
+    """
+    Formats the analysis prompt for one document (or one shard of it). With
+    `changed_only` the text is the changed clauses of a re-submitted document.
+    """
+    context = "\n".join([doc.page_content for doc in context_docs])
+    part_note = PART_NOTE.format(part=part, total=total) if total > 1 else ""
+    if changed_only:
+        part_note += CHANGED_ONLY_NOTE
+    return ANALYSIS_PROMPT_TEMPLATE.format(part_note=part_note, context=context, document=document_text)
+
+
+def merge_issues(results: List[dict]) -> List[dict]:
+    """Concatenates `issues_found` arrays, dropping duplicate section/issue pairs."""
+    merged = []
+    seen = set()
+    for result in results:
+        for issue in result.get("issues_found") or []:
+            if not isinstance(issue, dict):
+                continue
+            key = (
+                str(issue.get("section", "")).strip().lower(),
+                str(issue.get("issue", "")).strip().lower()
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(issue)
+    return merged
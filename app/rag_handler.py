@@ -1,143 +1,314 @@
 # app/rag_handler.py
 
-import os
-import faiss
 import json
 import re
-from sentence_transformers import SentenceTransformer
-from langchain_community.document_loaders import DirectoryLoader, Docx2txtLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import ChatGoogleGenerativeAI
-from dotenv import load_dotenv
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 
 from config import (
-    CORPUS_DIR, FAISS_INDEX_PATH, EMBEDDING_MODEL,
-    LLM_PROVIDER
+    FAISS_INDEX_PATH, CHUNK_STORE_DIR, EMBEDDING_MODEL, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH,
+    EMBEDDING_STORAGE_DTYPE, LLM_CACHE_ENABLED, LLM_CACHE_PATH,
+    LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, RETRIEVAL_MODE,
+    RETRIEVAL_QUERY_CHUNK_CHARS, RETRIEVAL_MAX_QUERIES,
+    RETRIEVAL_CONTEXT_TOKEN_BUDGET, RETRIEVAL_RRF_K, RETRIEVAL_VECTOR_WEIGHT,
+    RETRIEVAL_LEXICAL_WEIGHT, LLM_PROMPT_TOKEN_BUDGET,
+    LLM_CONTEXT_TOKEN_BUDGET, LLM_MAX_PARALLEL_SHARDS
 )
-from app.utils import logger
-
-# --- API Key Loading ---
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-# ---------------------
+from app.cache import AnalysisCache, make_cache_key
+from app.llm_providers import LLMProvider, create_llm_provider
+from app.metrics import span, map_in_context
+from app.prompts import (
+    PROMPT_VERSION, TEMPLATE_TOKENS, build_analysis_prompt, merge_issues,
+    select_context, shard_document
+)
+from app.utils import logger, estimate_tokens, split_into_clauses
 
 
 class RAGHandler:
-    def __init__(self):
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+    """
+    Retrieval and LLM analysis over the ADGM corpus.
+
+    The embedding model and vector store are heavy to import and load. With
+    `warm_up_async=True` they are loaded on a background thread and `status`
+    reports "loading", "ready" or "error"; methods that need them block until
+    loading has finished.
+
+    An `embedder` can be passed in instead of loading the configured model,
+    and `index_path`/`store_dir` point the corpus index elsewhere (e.g. the
+    benchmarks keep their own under a temporary directory).
+    """
+
+    def __init__(self, llm_provider: LLMProvider = None, warm_up_async: bool = False,
+                 embedder=None, index_path: str = FAISS_INDEX_PATH, store_dir: str = CHUNK_STORE_DIR,
+                 use_analysis_cache: bool = LLM_CACHE_ENABLED):
+        self.embedder = embedder
+        self.llm_provider = llm_provider or create_llm_provider()
+        self.index_path = index_path
+        self.store_dir = store_dir
         self.index = None
         self.documents = []
-        self._load_or_create_vector_store()
+        self.lexical_index = None
+        self.analysis_cache = AnalysisCache(
+            LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS
+        ) if use_analysis_cache else None
+        self.status = "loading"
+        self.load_error = None
+        self._ready = threading.Event()
+        if warm_up_async:
+            threading.Thread(target=self._warm_up, name="rag-warm-up", daemon=True).start()
+        else:
+            self._warm_up()
+            if self.load_error:
+                raise RuntimeError(self.load_error)
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until warm-up has finished; returns True if it succeeded."""
+        self._ready.wait(timeout)
+        return self.is_ready
+
+    def _ensure_ready(self):
+        if not self.wait_until_ready():
+            raise RuntimeError(f"The knowledge base failed to load: {self.load_error}")
+
+    def _warm_up(self):
+        """Imports and loads the embedding model and vector store."""
+        try:
+            logger.info("Loading embedding model and vector store...")
+            if self.embedder is None:
+                from sentence_transformers import SentenceTransformer
+                from app.embeddings import Embedder, EmbeddingCache
+                embedding_cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH, storage_dtype=EMBEDDING_STORAGE_DTYPE
+                ) if EMBEDDING_CACHE_ENABLED else None
+                self.embedder = Embedder(SentenceTransformer(EMBEDDING_MODEL), EMBEDDING_MODEL, cache=embedding_cache)
+            self._load_or_create_vector_store()
+            # The first encode call initializes the model's kernels; pay for it here
+            self.embedder.encode_queries(["warm-up"])
+            self.status = "ready"
+            logger.info("Embedding model and vector store are ready.")
+        except Exception as e:
+            logger.error(f"Failed to load the embedding model or vector store: {e}", exc_info=True)
+            self.load_error = str(e)
+            self.status = "error"
+        finally:
+            self._ready.set()
 
     def _load_or_create_vector_store(self):
-        """Loads the FAISS index if it exists, otherwise creates it."""
-        if os.path.exists(FAISS_INDEX_PATH):
-            logger.info("Loading existing FAISS index.")
-            self.index = faiss.read_index(FAISS_INDEX_PATH)
-            self._process_corpus()
-        else:
-            logger.info("No FAISS index found. Creating a new one.")
-            self._process_corpus()
-            self._create_faiss_index()
-
-    def _process_corpus(self):
-        """Loads and processes documents from the ADGM corpus directory."""
-        loader = DirectoryLoader(
-            CORPUS_DIR,
-            glob="**/*.docx",
-            loader_cls=Docx2txtLoader,
-            show_progress=True,
-            use_multithreading=True
-        )
-        docs = loader.load()
-        if not docs:
-            logger.warning(f"No .docx files found in the corpus directory: {CORPUS_DIR}. The RAG system will have no knowledge base.")
-            self.documents = []
-            return
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-        self.documents = text_splitter.split_documents(docs)
-        logger.info(f"Processed {len(self.documents)} document chunks from the corpus.")
-
-    def _create_faiss_index(self):
-        """Creates a FAISS index from the processed document chunks."""
-        if not self.documents:
-            logger.error("Cannot create FAISS index because no documents were loaded from the corpus.")
-            return
-        logger.info("Creating embeddings for the corpus...")
-        embeddings = self.embedding_model.encode([doc.page_content for doc in self.documents])
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings)
-        faiss.write_index(self.index, FAISS_INDEX_PATH)
-        logger.info(f"FAISS index created and saved to {FAISS_INDEX_PATH}")
-
-    def retrieve_relevant_docs(self, query: str, k: int = 5) -> list:
-        """Retrieves the top-k relevant document chunks for a given query."""
+        """
+        Loads the FAISS index and its persisted chunk store, incrementally
+        re-indexing any corpus files that were added, changed or removed.
+        """
+        from app.indexer import CorpusIndexer
+        from app.vector_index import configure_search
+        indexer = CorpusIndexer(self.embedder, index_path=self.index_path, store_dir=self.store_dir)
+        self.index, self.documents = indexer.sync()
+        configure_search(self.index)
+        self.lexical_index = indexer.load_lexical_index(self.documents)
+
+    def _embed_queries(self, texts: list):
+        """Embeds query texts, normalized to match the index metric."""
+        from app.vector_index import prepare_vectors
+        with span("embed", queries=len(texts), chars=sum(len(text) for text in texts)):
+            return prepare_vectors(self.embedder.encode_queries(texts))
+
+    def retrieve_relevant_docs(self, query: str, k: int = 5, mode: str = RETRIEVAL_MODE) -> list:
+        """
+        Retrieves relevant document chunks for a given query.
+
+        In "single" mode the whole query is embedded once and the top-k chunks
+        are returned. In "multi_query" mode the query is split into clauses,
+        each clause retrieves its top-k chunks and the hits are fused into one
+        context set under the retrieval token budget. "hybrid" additionally
+        fuses in BM25 lexical hits over the same chunks.
+        """
+        self._ensure_ready()
         if self.index is None or not self.documents:
             logger.error("FAISS index is not initialized or no documents are loaded.")
             return []
-        query_embedding = self.embedding_model.encode([query])
-        distances, indices = self.index.search(query_embedding, k)
-        return [self.documents[i] for i in indices[0]]
+        if mode == "multi_query":
+            return self._retrieve_multi_query(query, k)
+        if mode == "hybrid":
+            return self._retrieve_hybrid(query, k)
+        if mode != "single":
+            raise ValueError(f"Unsupported retrieval mode: {mode}")
+        query_embedding = self._embed_queries([query])
+        with span("search", kind="vector", queries=1, k=k):
+            distances, chunk_ids = self.index.search(query_embedding, k)
+        results = [self.documents.get(chunk_id) for chunk_id in chunk_ids[0] if chunk_id != -1]
+        return [chunk for chunk in results if chunk is not None]
 
-    def get_llm_response(self, user_doc_text: str, relevant_docs: list) -> str:
+    def _vector_scores(self, query: str, k: int) -> dict:
+        """Batched clause-level vector search, fused into chunk scores with reciprocal rank fusion."""
+        clauses = split_into_clauses(query, RETRIEVAL_QUERY_CHUNK_CHARS)
+        if not clauses:
+            return {}
+        if len(clauses) > RETRIEVAL_MAX_QUERIES:
+            # Sample evenly so the whole document is still represented
+            step = len(clauses) / RETRIEVAL_MAX_QUERIES
+            clauses = [clauses[int(i * step)] for i in range(RETRIEVAL_MAX_QUERIES)]
+
+        query_embeddings = self._embed_queries(clauses)
+        with span("search", kind="vector", queries=len(clauses), k=k):
+            distances, chunk_ids = self.index.search(query_embeddings, k)
+
+        fused_scores = {}
+        for row in chunk_ids:
+            for rank, chunk_id in enumerate(row):
+                if chunk_id == -1:
+                    continue
+                fused_scores[int(chunk_id)] = fused_scores.get(int(chunk_id), 0.0) + 1.0 / (RETRIEVAL_RRF_K + rank + 1)
+        return fused_scores
+
+    def _select_within_budget(self, scores: dict) -> list:
+        """Returns the best-scoring chunks that fit in the retrieval token budget."""
+        results = []
+        used_tokens = 0
+        for chunk_id in sorted(scores, key=scores.get, reverse=True):
+            chunk = self.documents.get(chunk_id)
+            if chunk is None:
+                continue
+            chunk_tokens = estimate_tokens(chunk.page_content)
+            if results and used_tokens + chunk_tokens > RETRIEVAL_CONTEXT_TOKEN_BUDGET:
+                break
+            results.append(chunk)
+            used_tokens += chunk_tokens
+        return results
+
+    def _retrieve_multi_query(self, query: str, k: int) -> list:
+        fused_scores = self._vector_scores(query, k)
+        results = self._select_within_budget(fused_scores)
+        logger.info(f"Multi-query retrieval: {len(fused_scores)} candidate chunks, {len(results)} selected.")
+        return results
+
+    def _retrieve_hybrid(self, query: str, k: int) -> list:
+        """
+        Fuses the multi-query vector ranking with a BM25 ranking of the whole
+        query, so exact terms (e.g. "ADGM Courts", "UBO", regulation numbers)
+        surface even when the dense embeddings miss them.
+        """
+        vector_scores = self._vector_scores(query, k)
+        lexical_hits = []
+        if self.lexical_index:
+            with span("search", kind="lexical", queries=1, k=k * 4):
+                lexical_hits = self.lexical_index.search(query, k * 4)
+
+        # Normalize the vector side to [0, 1] so both rankings contribute on the same scale
+        top_vector_score = max(vector_scores.values(), default=0.0) or 1.0
+        fused_scores = {
+            chunk_id: RETRIEVAL_VECTOR_WEIGHT * score / top_vector_score
+            for chunk_id, score in vector_scores.items()
+        }
+        for rank, (chunk_id, _) in enumerate(lexical_hits):
+            lexical_score = (RETRIEVAL_RRF_K + 1) / (RETRIEVAL_RRF_K + rank + 1)
+            fused_scores[chunk_id] = fused_scores.get(chunk_id, 0.0) + RETRIEVAL_LEXICAL_WEIGHT * lexical_score
+
+        results = self._select_within_budget(fused_scores)
+        logger.info(f"Hybrid retrieval: {len(vector_scores)} vector and {len(lexical_hits)} lexical candidates, {len(results)} selected.")
+        return results
+
+    def get_llm_response(self, user_doc_text: str, relevant_docs: list, use_cache: bool = True,
+                         changed_only: bool = False) -> str:
         """
         Generates a response from the LLM using the user's document and retrieved context.
+
+        The prompt is kept within LLM_PROMPT_TOKEN_BUDGET: context is trimmed to
+        LLM_CONTEXT_TOKEN_BUDGET and documents that still do not fit are split
+        into clause-group shards analyzed in parallel, with their issues merged.
+        Successful responses are cached unless `use_cache` is False. Set
+        `changed_only` when the text holds only the changed clauses of a
+        re-submitted document.
         """
-        if LLM_PROVIDER == "gemini":
-            if not GEMINI_API_KEY:
-                logger.error("GEMINI_API_KEY not found. Make sure it's set in your .env file.")
-                return '{"error": "Server configuration error: Missing Gemini API Key."}'
-
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-flash-latest",
-                google_api_key=GEMINI_API_KEY,
-                timeout=120, # Corrected parameter name from 'request_timeout' to 'timeout'
-                model_kwargs={"response_mime_type": "application/json"}
-            )
+        with span("llm_analysis", document_tokens=estimate_tokens(user_doc_text), cache_hit=False,
+                  changed_only=changed_only) as attributes:
+            return self._get_llm_response(user_doc_text, relevant_docs, use_cache, changed_only, attributes)
+
+    def _get_llm_response(self, user_doc_text: str, relevant_docs: list, use_cache: bool,
+                          changed_only: bool, attributes: dict) -> str:
+        cache_key = None
+        if use_cache and self.analysis_cache is not None:
+            key_parts = {
+                "document_sha256": hashlib.sha256(user_doc_text.encode("utf-8")).hexdigest(),
+                "context_chunk_ids": [getattr(doc, "chunk_id", None) for doc in relevant_docs],
+                "prompt_version": PROMPT_VERSION,
+                "model": self.llm_provider.model_id
+            }
+            if changed_only:
+                key_parts["changed_only"] = True
+            cache_key = make_cache_key(**key_parts)
+            cached_response = self.analysis_cache.get(cache_key)
+            if cached_response is not None:
+                logger.info("Returning cached LLM analysis for unchanged document.")
+                attributes["cache_hit"] = True
+                return cached_response
+
+        configuration_error = self.llm_provider.configuration_error()
+        if configuration_error:
+            logger.error(configuration_error)
+            return json.dumps({"error": f"Server configuration error: {configuration_error}"})
 
+        context_docs = select_context(relevant_docs, LLM_CONTEXT_TOKEN_BUDGET)
+        context_tokens = sum(estimate_tokens(doc.page_content) for doc in context_docs)
+        document_budget = max(LLM_PROMPT_TOKEN_BUDGET - TEMPLATE_TOKENS - context_tokens, 1)
+        shards = shard_document(user_doc_text, document_budget)
+        attributes.update(context_tokens=context_tokens, shards=len(shards))
+
+        if len(shards) == 1:
+            results = [self._analyze_prompt(build_analysis_prompt(user_doc_text, context_docs, changed_only=changed_only))]
         else:
-            raise ValueError("Unsupported LLM provider specified in config.")
-
-        context = "\n".join([doc.page_content for doc in relevant_docs])
-
-        prompt = f"""
-        Analyze the **User Submitted Document Text** based on the **ADGM Legal Context**.
-        Identify compliance issues, red flags, or missing information.
-        Your entire response must be a single, valid JSON object.
-        This object must have one key: "issues_found".
-        The value of "issues_found" must be a JSON array of objects.
-        Each object in the array must contain four string keys: "section", "issue", "severity", and "suggestion".
-        Do not include any text, explanations, or markdown formatting before or after the JSON object.
-
-        **ADGM Legal Context:**
-        ---
-        {context}
-        ---
-
-        **User Submitted Document Text:**
-        ---
-        {user_doc_text}
-        ---
-        """
+            logger.info(f"Document exceeds the prompt budget; analyzing it as {len(shards)} shards.")
+            prompts = [
+                build_analysis_prompt(shard, context_docs, part=i + 1, total=len(shards), changed_only=changed_only)
+                for i, shard in enumerate(shards)
+            ]
+            with ThreadPoolExecutor(max_workers=min(LLM_MAX_PARALLEL_SHARDS, len(prompts))) as executor:
+                results = map_in_context(executor, self._analyze_prompt, prompts)
 
+        succeeded = [result for result, ok in results if ok]
+        if not succeeded:
+            # Mark the fallback so callers do not mistake it for a genuine analysis
+            return json.dumps({**results[0][0], "failed_shards": len(results)})
+        response = {"issues_found": merge_issues(succeeded)}
+        if len(succeeded) < len(results):
+            response["failed_shards"] = len(results) - len(succeeded)
+
+        response_str = json.dumps(response)
+        if cache_key and len(succeeded) == len(results):
+            self.analysis_cache.put(cache_key, response_str)
+        return response_str
+
+    def _analyze_prompt(self, prompt: str) -> Tuple[dict, bool]:
+        """
+        Sends one analysis prompt and parses the JSON reply. Returns the parsed
+        result and whether it is a genuine analysis (as opposed to a fallback).
+        """
+        content = ""
         try:
-            response = llm.invoke(prompt)
-            content = response.content.strip()
-            # Use regex to find the JSON object within the string, in case of markdown wrappers
-            match = re.search(r'\{.*\}', content, re.DOTALL)
-            if match:
-                clean_json_str = match.group(0)
-            else:
-                clean_json_str = content
-
-            # This will raise an error if the string is not valid JSON
-            json.loads(clean_json_str)
-            return clean_json_str
+            content = self.llm_provider.invoke(prompt).strip()
+            with span("json_repair", response_chars=len(content)) as attributes:
+                # Use regex to find the JSON object within the string, in case of markdown wrappers
+                match = re.search(r'\{.*\}', content, re.DOTALL)
+                if match:
+                    clean_json_str = match.group(0)
+                else:
+                    clean_json_str = content
+                attributes["stripped_wrapper"] = len(clean_json_str) != len(content)
+
+                # This will raise an error if the string is not valid JSON
+                parsed = json.loads(clean_json_str)
+                if not isinstance(parsed, dict) or not isinstance(parsed.get("issues_found"), list):
+                    raise json.JSONDecodeError("Missing 'issues_found' array", clean_json_str, 0)
+                attributes["issues"] = len(parsed["issues_found"])
+            return parsed, True
         except json.JSONDecodeError as json_error:
             logger.error(f"LLM response was not valid JSON: {json_error}")
-            logger.error(f"Raw LLM response: {response.content}")
-            return '{{"issues_found": [{"section": "General", "issue": "The AI model returned a response that was not in the correct format. This may be a temporary issue.", "severity": "Error", "suggestion": "Please try analyzing the document again."}]}}'
+            logger.error(f"Raw LLM response: {content}")
+            return {"issues_found": [{"section": "General", "issue": "The AI model returned a response that was not in the correct format. This may be a temporary issue.", "severity": "Error", "suggestion": "Please try analyzing the document again."}]}, False
         except Exception as e:
             logger.error(f"Error getting response from LLM: {e}", exc_info=True)
-            return '{{"error": "An unexpected error occurred while communicating with the AI model."}}'
+            return {"error": "An unexpected error occurred while communicating with the AI model."}, False
@@ -0,0 +1,153 @@
+# app/revisions.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import difflib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+from app.utils import logger
+
+
+def fingerprint_paragraphs(paragraph_texts: List[str]) -> List[str]:
+    """Whitespace- and case-insensitive fingerprint of each paragraph."""
+    return [
+        hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()[:16]
+        for text in paragraph_texts
+    ]
+
+
+def revision_key(client_id: str, file_name: str, document_type: str) -> str:
+    """
+    Identifies "the same document" across submissions of one client or matter:
+    its file name and type within `client_id`. Documents are never matched
+    across clients.
+    """
+    if not client_id:
+        raise ValueError("A client ID is required to look up document revisions.")
+    payload = f"{client_id}\0{os.path.basename(file_name).lower()}\0{document_type}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RevisionDiff:
+    """Paragraph-level diff between a stored revision and a new one."""
+    old_to_new: Dict[int, int] = field(default_factory=dict)
+    changed: List[int] = field(default_factory=list)
+    total: int = 0
+
+    @property
+    def unchanged_ratio(self) -> float:
+        return len(self.old_to_new) / self.total if self.total else 1.0
+
+
+def diff_revisions(old_fingerprints: List[str], new_fingerprints: List[str]) -> RevisionDiff:
+    """
+    Maps every unchanged old paragraph to its position in the new document and
+    lists the new paragraphs that were inserted or edited. A deletion marks
+    the new paragraphs on either side of it as changed, so the clauses around
+    removed text are re-reviewed.
+    """
+    # autojunk would treat repeated fingerprints (e.g. blank paragraphs) as noise
+    matcher = difflib.SequenceMatcher(None, old_fingerprints, new_fingerprints, autojunk=False)
+    diff = RevisionDiff(total=len(new_fingerprints))
+    changed = set()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                diff.old_to_new[i1 + offset] = j1 + offset
+        elif tag in ("replace", "insert"):
+            changed.update(range(j1, j2))
+        elif tag == "delete":
+            changed.update(j for j in (j1 - 1, j1) if 0 <= j < len(new_fingerprints))
+    diff.changed = sorted(changed)
+    return diff
+
+
+def changed_excerpt(paragraph_texts: List[str], changed: List[int], context_paragraphs: int) -> str:
+    """The changed paragraphs plus `context_paragraphs` neighbours on each side, in document order."""
+    selected = set()
+    for index in changed:
+        selected.update(range(max(0, index - context_paragraphs), min(len(paragraph_texts), index + context_paragraphs + 1)))
+    return "\n".join(paragraph_texts[i] for i in sorted(selected) if paragraph_texts[i].strip())
+
+
+def carry_forward_issues(issues: List[Dict[str, Any]], diff: RevisionDiff) -> List[Dict[str, Any]]:
+    """
+    Keeps the stored issues that still apply: those anchored to a paragraph that
+    is unchanged, with the anchor remapped to its new position. Issues on edited
+    or removed paragraphs are dropped, since the changed clauses are analyzed
+    again. Issues without an anchor (about the document as a whole, or whose
+    section could not be placed) can't be tied to unchanged text, so they are
+    only kept when nothing changed; a changed document holding any is
+    analyzed in full instead.
+    """
+    changed = set(diff.changed)
+    carried = []
+    for issue in issues:
+        anchor = issue.get("anchor_paragraph")
+        if anchor is None:
+            if not changed:
+                carried.append(dict(issue))
+        elif anchor in diff.old_to_new and diff.old_to_new[anchor] not in changed:
+            carried.append({**issue, "anchor_paragraph": diff.old_to_new[anchor]})
+    return carried
+
+
+class RevisionStore:
+    """
+    Persistent SQLite store of the last analyzed revision of each document:
+    its paragraph fingerprints and the issues found, each anchored to a
+    paragraph index where it could be placed. Entries written by a different
+    model or prompt version are ignored, and entries expire after `ttl_seconds`.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: Optional[float] = None):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS revisions (
+                   key TEXT PRIMARY KEY,
+                   analyzer TEXT NOT NULL,
+                   fingerprints TEXT NOT NULL,
+                   issues TEXT NOT NULL,
+                   updated_at REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    def get(self, key: str, analyzer: str) -> Optional[Dict[str, Any]]:
+        """Returns {"fingerprints", "issues"} of the stored revision, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT analyzer, fingerprints, issues, updated_at FROM revisions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] != analyzer:
+            return None
+        if self.ttl_seconds is not None and time.time() - row[3] > self.ttl_seconds:
+            return None
+        return {"fingerprints": json.loads(row[1]), "issues": json.loads(row[2])}
+
+    def put(self, key: str, analyzer: str, fingerprints: List[str], issues: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO revisions (key, analyzer, fingerprints, issues, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, analyzer, json.dumps(fingerprints), json.dumps(issues), now)
+            )
+            if self.ttl_seconds is not None:
+                self._conn.execute("DELETE FROM revisions WHERE updated_at < ?", (now - self.ttl_seconds,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM revisions")
+            self._conn.commit()
+        logger.info(f"Cleared revision store at {self.db_path}")
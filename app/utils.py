@@ -1,7 +1,11 @@
 # app/utils.py
 
 import logging
-from config import LOG_LEVEL
+import re
+import threading
+import time
+from typing import List
+from config import LOG_LEVEL, LLM_RATE_LIMITS
 
 def setup_logger():
     """
@@ -15,3 +19,89 @@ def setup_logger():
     return logging.getLogger(__name__)
 
 logger = setup_logger()
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting calls to `rate_per_minute`, with bursts of
+    at most `burst` calls.
+    """
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.interval = 60.0 / rate_per_minute
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a call is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) / self.interval)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider: str):
+    """
+    Returns the process-wide rate limiter for an LLM provider, or None if the
+    provider has no limit configured.
+    """
+    limits = LLM_RATE_LIMITS.get(provider)
+    if not limits:
+        return None
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = RateLimiter(limits["requests_per_minute"], limits.get("burst", 1))
+        return _rate_limiters[provider]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English legal text),
+    used for budgeting prompts without calling a tokenizer.
+    """
+    return (len(text) + 3) // 4
+
+def split_into_clauses(text: str, max_chars: int) -> List[str]:
+    """
+    Splits text into clause-sized pieces of at most `max_chars` characters,
+    grouping consecutive paragraphs and breaking overlong paragraphs on
+    sentence boundaries.
+    """
+    pieces = []
+    for paragraph in (p.strip() for p in text.splitlines()):
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        sentence_group = ""
+        for sentence in re.split(r'(?<=[.;:])\s+', paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence_group and len(sentence_group) + len(sentence) + 1 > max_chars:
+                pieces.append(sentence_group)
+                sentence_group = ""
+            sentence_group = f"{sentence_group} {sentence}".strip()
+        if sentence_group:
+            pieces.append(sentence_group)
+
+    clauses = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            clauses.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        clauses.append(current)
+    return clauses
@@ -0,0 +1,133 @@
+# app/vector_index.py
+
+from typing import Dict, Any, Optional
+
+import faiss
+import numpy as np
+
+from config import (
+    FAISS_INDEX_TYPE, FAISS_METRIC, FAISS_IVF_NLIST, FAISS_PQ_M, FAISS_HNSW_M,
+    FAISS_NPROBE, FAISS_EF_SEARCH, FAISS_EF_CONSTRUCTION
+)
+from app.utils import logger
+
+INDEX_TYPES = ("Flat", "HNSW", "IVF", "IVFPQ", "SQ8", "SQfp16")
+METRICS = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+
+# FAISS warns below ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_settings(index_type: str = FAISS_INDEX_TYPE, metric: str = FAISS_METRIC) -> Dict[str, Any]:
+    """The settings an index is built with; a change to any of them requires a rebuild."""
+    settings = {"type": index_type, "metric": metric}
+    if index_type in ("IVF", "IVFPQ"):
+        settings["nlist"] = FAISS_IVF_NLIST
+    if index_type == "IVFPQ":
+        settings["pq_m"] = FAISS_PQ_M
+    if index_type == "HNSW":
+        settings["hnsw_m"] = FAISS_HNSW_M
+        settings["ef_construction"] = FAISS_EF_CONSTRUCTION
+    return settings
+
+
+def prepare_vectors(vectors: np.ndarray, metric: str = FAISS_METRIC) -> np.ndarray:
+    """Returns contiguous float32 vectors, L2-normalized for inner-product (cosine) search."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if metric == "ip":
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _ivf_nlist(num_vectors: int) -> int:
+    """The number of IVF lists `num_vectors` training points support, capped at FAISS_IVF_NLIST."""
+    return max(1, min(FAISS_IVF_NLIST, num_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def _can_train_pq(num_vectors: int, dimension: int) -> bool:
+    return dimension % FAISS_PQ_M == 0 and num_vectors >= 256
+
+
+def _factory_description(index_type: str, num_vectors: int, dimension: int) -> str:
+    if index_type == "Flat":
+        return "IDMap,Flat"
+    if index_type == "HNSW":
+        return f"IDMap,HNSW{FAISS_HNSW_M}"
+    if index_type in ("SQ8", "SQfp16"):
+        return f"IDMap,{index_type}"
+
+    nlist = _ivf_nlist(num_vectors)
+    if nlist < FAISS_IVF_NLIST:
+        logger.warning(f"Only {num_vectors} vectors to train on; using {nlist} IVF lists instead of {FAISS_IVF_NLIST}.")
+    if index_type == "IVFPQ":
+        if _can_train_pq(num_vectors, dimension):
+            return f"IDMap,IVF{nlist},PQ{FAISS_PQ_M}"
+        logger.warning("Not enough vectors (or an incompatible dimension) to train PQ codes; storing IVF vectors uncompressed.")
+    return f"IDMap,IVF{nlist},Flat"
+
+
+def built_index_settings(index: faiss.Index) -> Dict[str, Any]:
+    """
+    The structure an index was actually built with, which for IVF types can
+    be smaller than configured (fewer lists, or no PQ) when there were few
+    vectors to train on.
+    """
+    underlying = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    settings = {"class": type(underlying).__name__}
+    if isinstance(underlying, faiss.IndexIVF):
+        settings["nlist"] = underlying.nlist
+    if isinstance(underlying, faiss.IndexIVFPQ):
+        settings["pq_m"] = underlying.pq.M
+    return settings
+
+
+def needs_retraining(index: faiss.Index, num_vectors: int, index_type: str = FAISS_INDEX_TYPE) -> bool:
+    """
+    True when an IVF index built on a small corpus has been outgrown: the
+    `num_vectors` it will hold support at least twice its number of lists (or
+    the full configured count), or PQ codes that could not be trained before.
+    """
+    underlying = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if not isinstance(underlying, faiss.IndexIVF):
+        return False
+    target_nlist = _ivf_nlist(num_vectors)
+    if target_nlist > underlying.nlist and target_nlist >= min(FAISS_IVF_NLIST, 2 * underlying.nlist):
+        return True
+    return (index_type == "IVFPQ" and not isinstance(underlying, faiss.IndexIVFPQ)
+            and _can_train_pq(num_vectors, index.d))
+
+
+def build_index(training_vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE,
+                metric: str = FAISS_METRIC) -> faiss.Index:
+    """
+    Creates an empty ID-mapped index of the configured type, trained on
+    `training_vectors` (already prepared) when the type needs training.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported FAISS index type: {index_type}")
+    if metric not in METRICS:
+        raise ValueError(f"Unsupported FAISS metric: {metric}")
+    num_vectors, dimension = training_vectors.shape
+    description = _factory_description(index_type, num_vectors, dimension)
+    index = faiss.index_factory(dimension, description, METRICS[metric])
+
+    underlying = faiss.downcast_index(index.index)
+    if isinstance(underlying, faiss.IndexHNSW):
+        underlying.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+    if not index.is_trained:
+        logger.info(f"Training {description} index on {num_vectors} vectors...")
+        index.train(training_vectors)
+    logger.info(f"Created FAISS index '{description}' ({metric}).")
+    return index
+
+
+def configure_search(index: Optional[faiss.Index], nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH) -> None:
+    """Applies the query-time parameters (IVF nprobe, HNSW efSearch) to an index."""
+    if index is None:
+        return
+    underlying = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(underlying, faiss.IndexIVF):
+        underlying.nprobe = nprobe
+    elif isinstance(underlying, faiss.IndexHNSW):
+        underlying.hnsw.efSearch = ef_search
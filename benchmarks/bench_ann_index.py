@@ -0,0 +1,85 @@
+# benchmarks/bench_ann_index.py
+"""
+Recall-vs-latency benchmark of the configurable FAISS index types against
+the exact Flat baseline, on synthetic clustered, normalized vectors shaped
+like MiniLM embeddings (384 dimensions).
+
+    python benchmarks/bench_ann_index.py [--vectors 100000] [--queries 500] [--k 10]
+        [--types Flat HNSW IVF IVFPQ SQ8] [--metric ip] [--nprobe 1 8 32] [--ef-search 16 64 256]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.vector_index import build_index, configure_search, prepare_vectors
+
+
+def make_vectors(count: int, dimension: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centers[labels] + 0.35 * rng.standard_normal((count, dimension)).astype(np.float32)
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    started = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - started) / len(queries)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--metric", choices=["l2", "ip"], default="ip")
+    parser.add_argument("--types", nargs="+", default=["Flat", "HNSW", "IVF", "IVFPQ", "SQ8"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    clusters = max(8, args.vectors // 500)
+    corpus = prepare_vectors(make_vectors(args.vectors, args.dimension, clusters, rng), args.metric)
+    queries = prepare_vectors(make_vectors(args.queries, args.dimension, clusters, rng), args.metric)
+    ids = np.arange(args.vectors, dtype=np.int64)
+
+    baseline = build_index(corpus, "Flat", args.metric)
+    baseline.add_with_ids(corpus, ids)
+    truth, flat_latency = timed_search(baseline, queries, args.k)
+
+    print(f"{args.vectors} vectors x {args.dimension}d, {args.queries} queries, recall@{args.k} vs Flat ({args.metric})")
+    print(f"{'index':<10}{'param':<16}{'build s':>10}{'recall':>10}{'ms/query':>12}{'speedup':>10}")
+    for index_type in args.types:
+        started = time.perf_counter()
+        index = build_index(corpus, index_type, args.metric)
+        index.add_with_ids(corpus, ids)
+        build_seconds = time.perf_counter() - started
+
+        if index_type in ("IVF", "IVFPQ"):
+            settings = [(f"nprobe={n}", {"nprobe": n}) for n in args.nprobe]
+        elif index_type == "HNSW":
+            settings = [(f"efSearch={ef}", {"ef_search": ef}) for ef in args.ef_search]
+        else:
+            settings = [("-", {})]
+        for label, params in settings:
+            configure_search(index, **params)
+            found, latency = timed_search(index, queries, args.k)
+            print(f"{index_type:<10}{label:<16}{build_seconds:>10.2f}{recall_at_k(found, truth):>10.3f}"
+                  f"{latency * 1000:>12.3f}{flat_latency / max(latency, 1e-12):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/bench_comment_placement.py
+"""
+Compares comment placement through ParsedDocument.paragraph_index with the
+original per-issue scan over `doc.paragraphs` (`p.text.lower().strip()`), on
+a long synthetic agreement assembled from the paragraphs of the ADGM corpus
+templates, and checks that both place every comment on the same paragraph.
+
+    python benchmarks/bench_comment_placement.py [--paragraphs 6000] [--issues 60]
+"""
+
+import os
+import sys
+import glob
+import time
+import random
+import argparse
+
+import docx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import CORPUS_DIR
+from app.doc_processor import ParsedDocument
+
+
+def corpus_paragraphs() -> list:
+    paragraphs = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "**", "*.docx"), recursive=True)):
+        paragraphs += [p.text for p in docx.Document(path).paragraphs if p.text.strip()]
+    return paragraphs
+
+
+def make_document(source_paragraphs: list, count: int, seed: int = 7):
+    rng = random.Random(seed)
+    document = docx.Document()
+    for i in range(count):
+        document.add_paragraph(f"{i + 1}. {rng.choice(source_paragraphs)}")
+    return document
+
+
+def make_sections(paragraph_texts: list, count: int, seed: int = 11) -> list:
+    """Section strings as the LLM returns them: excerpts of real paragraphs plus a few misses."""
+    rng = random.Random(seed)
+    sections = []
+    for _ in range(count):
+        text = rng.choice(paragraph_texts).lower().strip()
+        start = rng.randint(0, max(0, len(text) - 40))
+        sections.append(text[start:start + rng.randint(12, 50)].strip())
+    sections += ["governing law of the abu dhabi global market", "ubo register retention period"]
+    return [s for s in sections if s]
+
+
+def original_find(document, query: str):
+    for i, p in enumerate(document.paragraphs):
+        if query in p.text.lower().strip():
+            return i
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=6000)
+    parser.add_argument("--issues", type=int, default=60)
+    args = parser.parse_args()
+
+    source = corpus_paragraphs()
+    if not source:
+        raise SystemExit(f"No corpus paragraphs found in {CORPUS_DIR}")
+    document = make_document(source, args.paragraphs)
+    sections = make_sections([p.text for p in document.paragraphs], args.issues)
+
+    started = time.perf_counter()
+    original_hits = [original_find(document, section) for section in sections]
+    original_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parsed = ParsedDocument("benchmark.docx", document)
+    index = parsed.paragraph_index
+    build_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    indexed_hits = [index.find(section) for section in sections]
+    lookup_seconds = time.perf_counter() - started
+
+    if original_hits != indexed_hits:
+        mismatches = [s for s, a, b in zip(sections, original_hits, indexed_hits) if a != b]
+        raise SystemExit(f"Placement differs from the original scan for {len(mismatches)} sections: {mismatches[:3]}")
+
+    found = sum(hit is not None for hit in indexed_hits)
+    print(f"{args.paragraphs} paragraphs, {len(sections)} issues ({found} placed), placements identical")
+    print(f"original scan:         {original_seconds * 1000:10.1f} ms")
+    print(f"parse texts + index:   {build_seconds * 1000:10.1f} ms")
+    print(f"indexed lookups:       {lookup_seconds * 1000:10.1f} ms")
+    print(f"speedup (lookups):     {original_seconds / max(lookup_seconds, 1e-9):10.1f}x")
+    print(f"speedup (incl. build): {original_seconds / max(build_seconds + lookup_seconds, 1e-9):10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# benchmarks/bench_pipeline.py
+"""
+Offline benchmark of the Corporate Agent pipeline.
+
+Generates synthetic .docx bundles from the templates in the corpus directory
+(each document keeps its template's title block, so it classifies like the
+original, followed by a configurable number of clauses sampled from that
+template), then measures:
+
+    parse       parse_docx, per document
+    classify    identify_document_type, per document
+    retrieve    RAGHandler.retrieve_relevant_docs, per document
+    annotate    add_comments_to_docx with the stub provider's issues, per document
+    submission  CorporateAgent.analyze_submission, per bundle (stub LLM, no LLM cache)
+
+and reports throughput, p50/p95 latency and peak traced memory per stage.
+The vector index and outputs are kept in a temporary directory, and the
+embedding, LLM analysis and revision caches are disabled, so no production
+store is opened. Results can be saved as a
+baseline and later runs compared against it; the exit status is 1 if any
+stage regressed by more than the tolerance.
+
+    python benchmarks/bench_pipeline.py [--bundles 3] [--docs-per-bundle 5] [--clauses 60]
+        [--repeats 3] [--hash-embeddings] [--write-bundles DIR]
+        [--baseline benchmarks/baseline.json] [--save-baseline] [--tolerance 0.25]
+"""
+
+import os
+import io
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import hashlib
+
+# Keep benchmark runs out of the production metrics files; set METRICS_ENABLED=true
+# to include the span overhead in the measurements
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+import docx
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import CORPUS_DIR, EMBEDDING_MODEL
+from app.core import CorporateAgent
+from app.doc_processor import parse_docx, identify_document_type, add_comments_to_docx
+from app.embeddings import Embedder
+from app.llm_providers import StubProvider
+from app.output_store import OutputStore
+from app.rag_handler import RAGHandler
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+TITLE_PARAGRAPHS = 5
+
+
+class NamedBytesIO(io.BytesIO):
+    """An in-memory upload with a file name, like Streamlit's UploadedFile."""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+class HashingEncoder:
+    """Deterministic stand-in for the sentence encoder, for fully offline runs."""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def encode(self, texts, **kwargs):
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        return vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+
+def make_handler(work_dir: str, hash_embeddings: bool) -> RAGHandler:
+    """
+    A RAGHandler with its own index under `work_dir`, an uncached embedder and
+    no LLM analysis cache, so no production store is opened.
+    """
+    if hash_embeddings:
+        model = HashingEncoder()
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(EMBEDDING_MODEL)
+    return RAGHandler(
+        llm_provider=StubProvider(), embedder=Embedder(model, EMBEDDING_MODEL),
+        index_path=os.path.join(work_dir, "index.faiss"), store_dir=os.path.join(work_dir, "chunks"),
+        use_analysis_cache=False
+    )
+
+
+# --- Synthetic bundles ---
+
+def load_templates() -> list:
+    """(file name, non-empty paragraph texts) for every corpus template."""
+    templates = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "**", "*.docx"), recursive=True)):
+        paragraphs = [p.text for p in docx.Document(path).paragraphs if p.text.strip()]
+        if paragraphs:
+            templates.append((os.path.basename(path), paragraphs))
+    return templates
+
+
+def make_document(paragraphs: list, clauses: int, rng) -> bytes:
+    document = docx.Document()
+    for text in paragraphs[:TITLE_PARAGRAPHS]:
+        document.add_paragraph(text)
+    body = paragraphs[TITLE_PARAGRAPHS:] or paragraphs
+    for i in range(clauses):
+        document.add_paragraph(f"{i + 1}. {rng.choice(body)}")
+    stream = io.BytesIO()
+    document.save(stream)
+    return stream.getvalue()
+
+
+def make_bundles(templates: list, bundles: int, docs_per_bundle: int, clauses: int, seed: int) -> list:
+    """A list of bundles, each a list of (file name, .docx bytes)."""
+    rng = random.Random(seed)
+    result = []
+    for b in range(bundles):
+        bundle = []
+        for d in range(docs_per_bundle):
+            name, paragraphs = templates[(b * docs_per_bundle + d) % len(templates)]
+            bundle.append((f"bundle{b + 1}-doc{d + 1}-{name}", make_document(paragraphs, clauses, rng)))
+        result.append(bundle)
+    return result
+
+
+def write_bundles(bundles: list, output_dir: str):
+    for b, bundle in enumerate(bundles):
+        bundle_dir = os.path.join(output_dir, f"bundle{b + 1}")
+        os.makedirs(bundle_dir, exist_ok=True)
+        for name, data in bundle:
+            with open(os.path.join(bundle_dir, name), "wb") as f:
+                f.write(data)
+
+
+# --- Measurement ---
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def measure(operations: list, repeats: int) -> dict:
+    """
+    Times each (setup, run) operation `repeats` times, then runs them once more
+    under tracemalloc for the peak memory. `setup` output is passed to `run`
+    and is not timed.
+    """
+    latencies = []
+    for _ in range(repeats):
+        for setup, run in operations:
+            argument = setup()
+            started = time.perf_counter()
+            run(argument)
+            latencies.append(time.perf_counter() - started)
+
+    arguments = [setup() for setup, _ in operations]
+    tracemalloc.start()
+    for (_, run), argument in zip(operations, arguments):
+        run(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "operations": len(latencies),
+        "throughput_per_second": round(len(latencies) / total, 3) if total else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "peak_memory_mb": round(peak / 2 ** 20, 3),
+    }
+
+
+def run_benchmarks(bundles: list, handler: RAGHandler, repeats: int, output_dir: str) -> dict:
+    documents = [document for bundle in bundles for document in bundle]
+
+    def uncached(value):
+        # Every timed retrieval encodes its queries; the in-memory query LRU was
+        # filled while the issues below were computed
+        handler.embedder.clear_query_cache()
+        return value
+
+    def upload(name, data):
+        return lambda: NamedBytesIO(data, name)
+
+    def parsed(name, data):
+        return lambda: parse_docx(NamedBytesIO(data, name))[0]
+
+    texts = {name: parsed(name, data)().text for name, data in documents}
+    issues = {
+        name: json.loads(handler.get_llm_response(texts[name], handler.retrieve_relevant_docs(texts[name]), use_cache=False))
+        .get("issues_found", [])
+        for name, _ in documents
+    }
+    # Every submission is analyzed in full; nothing is recorded for re-submission diffs
+    agent = CorporateAgent(rag_handler=handler, revisions_enabled=False)
+
+    results = {}
+    results["parse"] = measure([(upload(name, data), parse_docx) for name, data in documents], repeats)
+    results["classify"] = measure([(parsed(name, data), identify_document_type) for name, data in documents], repeats)
+    results["retrieve"] = measure(
+        [(lambda text=texts[name]: uncached(text), handler.retrieve_relevant_docs) for name, _ in documents], repeats
+    )
+    results["annotate"] = measure(
+        [(parsed(name, data), lambda document, found=issues[name]: add_comments_to_docx(document, found))
+         for name, data in documents],
+        repeats
+    )
+    results["submission"] = measure(
+        [(lambda bundle=bundle: uncached([NamedBytesIO(data, name) for name, data in bundle]),
+          lambda files: agent.analyze_submission(files, use_cache=False, output_store=OutputStore(output_dir)))
+         for bundle in bundles],
+        repeats
+    )
+    return results
+
+
+# --- Reporting ---
+
+def print_results(results: dict, baseline: dict = None, tolerance: float = 0.25) -> list:
+    """Prints the results table; returns the stages that regressed against the baseline."""
+    regressions = []
+    print(f"{'stage':<12}{'ops':>6}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak MB':>10}  vs baseline")
+    for stage, stats in results.items():
+        line = (f"{stage:<12}{stats['operations']:>6}{stats['throughput_per_second']:>10.1f}"
+                f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['peak_memory_mb']:>10.2f}")
+        reference = (baseline or {}).get("stages", {}).get(stage)
+        if reference:
+            deltas = []
+            for key in ("p95_ms", "peak_memory_mb"):
+                if reference[key]:
+                    change = stats[key] / reference[key] - 1
+                    deltas.append(f"{key} {change:+.0%}")
+                    if change > tolerance:
+                        regressions.append(f"{stage} {key}")
+            line += "  " + ", ".join(deltas)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bundles", type=int, default=3)
+    parser.add_argument("--docs-per-bundle", type=int, default=5)
+    parser.add_argument("--clauses", type=int, default=60, help="Clauses per synthetic document")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--hash-embeddings", action="store_true",
+                        help="Use a deterministic hashing encoder instead of the sentence-transformers model")
+    parser.add_argument("--write-bundles", metavar="DIR", help="Also write the synthetic bundles to DIR")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Save this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative increase in p95 latency or peak memory before a stage counts as regressed")
+    args = parser.parse_args()
+
+    templates = load_templates()
+    if not templates:
+        raise SystemExit(f"No .docx templates found in {CORPUS_DIR}")
+    bundles = make_bundles(templates, args.bundles, args.docs_per_bundle, args.clauses, args.seed)
+    if args.write_bundles:
+        write_bundles(bundles, args.write_bundles)
+
+    settings = {
+        "bundles": args.bundles,
+        "docs_per_bundle": args.docs_per_bundle,
+        "clauses": args.clauses,
+        "repeats": args.repeats,
+        "seed": args.seed,
+        "embeddings": "hashing" if args.hash_embeddings else EMBEDDING_MODEL,
+    }
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as work_dir:
+        handler = make_handler(work_dir, args.hash_embeddings)
+        print(f"{args.bundles} bundles x {args.docs_per_bundle} documents x {args.clauses} clauses, "
+              f"{args.repeats} repeats, {len(handler.documents)} corpus chunks ({settings['embeddings']})")
+        results = run_benchmarks(bundles, handler, args.repeats, os.path.join(work_dir, "output"))
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print(f"Warning: baseline {args.baseline} was recorded with different settings: {baseline.get('settings')}")
+    regressions = print_results(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "stages": results}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
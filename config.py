@@ -12,12 +12,71 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CORPUS_DIR = os.path.join(BASE_DIR, "adgm_corpus")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
 VECTOR_STORE_DIR = os.path.join(BASE_DIR, "vector_store")
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
 
 # --- RAG and LLM Configuration ---
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-LLM_PROVIDER = "gemini"
+EMBEDDING_BATCH_SIZE = 64
+# Persistent cache of corpus chunk embeddings; vectors are stored as "float32", or optionally
+# as lossy "float16" or "int8" to save space (the index is then built from the rounded vectors)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embedding_cache.sqlite3")
+EMBEDDING_STORAGE_DTYPE = "float32"
+EMBEDDING_QUERY_CACHE_SIZE = 2048
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini") # "gemini", or "stub" for offline runs
+LLM_MODEL = "gemini-1.5-flash-latest"
+LLM_TIMEOUT_SECONDS = 120
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BACKOFF_SECONDS = 2.0
+LLM_STUB_LATENCY_SECONDS = 0.0
+# Token budgets for a single analysis request; longer documents are sharded by clause groups
+LLM_PROMPT_TOKEN_BUDGET = 12000
+LLM_CONTEXT_TOKEN_BUDGET = 2500
+LLM_MAX_PARALLEL_SHARDS = 4
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Maximum number of documents analyzed concurrently (1 = sequential)
+ANALYSIS_MAX_WORKERS = 4
+# Headless batch runner: worker processes (each loads its own models) and documents per process
+BATCH_MAX_PROCESSES = 2
+BATCH_THREADS_PER_PROCESS = 2
+# Per-provider LLM rate limits (sustained requests per minute and burst size)
+LLM_RATE_LIMITS = {
+    "gemini": {"requests_per_minute": 15, "burst": 4},
+}
+# Persistent cache of LLM analysis results, keyed on document text, context and prompt
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_analysis_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = 5000
+LLM_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+# --- Retrieval Configuration ---
+# "multi_query" embeds the user document clause by clause; "single" embeds it as one query;
+# "hybrid" fuses multi_query vector hits with BM25 lexical hits over the same chunks
+RETRIEVAL_MODE = "hybrid"
+RETRIEVAL_QUERY_CHUNK_CHARS = 800
+RETRIEVAL_MAX_QUERIES = 64
+RETRIEVAL_CONTEXT_TOKEN_BUDGET = 2000
+RETRIEVAL_RRF_K = 60
+RETRIEVAL_VECTOR_WEIGHT = 1.0
+RETRIEVAL_LEXICAL_WEIGHT = 1.0
+BM25_K1 = 1.5
+BM25_B = 0.75
 FAISS_INDEX_PATH = os.path.join(VECTOR_STORE_DIR, "adgm_corpus.faiss")
+# --- Vector Index Configuration ---
+# "Flat" (exact), "HNSW", "IVF", "IVFPQ", "SQ8" or "SQfp16" (scalar-quantized flat storage)
+FAISS_INDEX_TYPE = "Flat"
+# "l2", or "ip" for cosine similarity (vectors are L2-normalized before indexing and search)
+FAISS_METRIC = "l2"
+FAISS_IVF_NLIST = 1024
+FAISS_PQ_M = 16
+FAISS_HNSW_M = 32
+FAISS_EF_CONSTRUCTION = 80
+# Query-time recall/latency knobs
+FAISS_NPROBE = 16
+FAISS_EF_SEARCH = 64
+# Chunk texts, metadata and the corpus manifest are persisted next to the index
+CHUNK_STORE_DIR = os.path.join(VECTOR_STORE_DIR, "adgm_corpus.chunks")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
 
 # --- Document Processing Configuration ---
 DOCUMENT_KEYWORDS = {
@@ -33,6 +92,50 @@ DOCUMENT_KEYWORDS = {
     "Unknown": []
 }
 
+# Classifier weighting: keyword hits in the title area or in short heading lines count more
+CLASSIFIER_TITLE_CHARS = 400
+CLASSIFIER_TITLE_WEIGHT = 3.0
+CLASSIFIER_HEADING_MAX_CHARS = 100
+CLASSIFIER_HEADING_WEIGHT = 2.0
+# Only scan the first N KB of a document's text when classifying (None scans everything)
+CLASSIFIER_SCAN_LIMIT_KB = None
+
+# Minimum share of a section's distinct words a paragraph must contain for a comment
+# to be placed there when no paragraph contains the exact section text (None disables)
+COMMENT_FUZZY_MATCH_THRESHOLD = 0.8
+
+# --- Output Configuration ---
+# Each submission's annotated documents and report are written to their own folder here
+SUBMISSIONS_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "submissions")
+# Submission folders older than this are removed when a new submission starts (None keeps them)
+SUBMISSION_RETENTION_HOURS = 24
+# Parsed .docx trees kept in memory from classification until annotation (None = one per
+# analysis worker). Other documents are re-parsed if they need annotating, which keeps
+# memory flat with bundle size at the cost of a second parse.
+MAX_RETAINED_PARSED_DOCUMENTS = None
+
+# --- Re-submission Configuration ---
+# The paragraph fingerprints and issues of each analyzed document are stored per client or
+# matter reference; when that client submits a document with the same file name and type
+# again, only the changed paragraphs (plus neighbours for context) are sent to the LLM and
+# issues on unchanged paragraphs are carried forward. Submissions without a reference are
+# always analyzed in full
+REVISIONS_ENABLED = True
+REVISION_STORE_PATH = os.path.join(CACHE_DIR, "revisions.sqlite3")
+REVISION_TTL_SECONDS = 30 * 24 * 60 * 60
+# Below this share of unchanged paragraphs the document is treated as new and analyzed in full
+REVISION_MIN_UNCHANGED_RATIO = 0.5
+REVISION_CONTEXT_PARAGRAPHS = 1
+
+# --- Pipeline Metrics Configuration ---
+# Per-stage spans are added to each submission report; completed traces are
+# appended to a JSON-lines file and stage latency histograms are rewritten in
+# Prometheus text format (e.g. for node_exporter's textfile collector), one
+# file per process with the process ID inserted before the extension
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_SPANS_PATH = os.path.join(OUTPUT_DIR, "metrics", "spans.jsonl")
+METRICS_PROMETHEUS_PATH = os.path.join(OUTPUT_DIR, "metrics", "corporate_agent.prom")
+
 # --- NEW: Legal Process Checklists ---
 # This dictionary defines the mandatory documents for key legal processes.
 PROCESS_CHECKLISTS = {
@@ -48,5 +151,5 @@ PROCESS_CHECKLISTS = {
 # ------------------------------------
 
 # Ensure required directories exist
-for path in [CORPUS_DIR, OUTPUT_DIR, VECTOR_STORE_DIR]:
+for path in [CORPUS_DIR, OUTPUT_DIR, VECTOR_STORE_DIR, CACHE_DIR]:
     os.makedirs(path, exist_ok=True)